@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 import asyncio
 import logging
-import struct
+import random
+import time
 from functools import partial
+from typing import Optional
 
 from .vendored.dbus_fast import DBusError
 from .vendored.dbus_fast import BusType
 from .vendored.dbus_fast.aio import ProxyInterface, MessageBus
 
 from .CMD import CTAPBLE_CMD
+from .CTAPFraming import ble_fragments
+from .FrameScheduler import FrameScheduler
+from .GattCache import GattCache, STALE_LAYOUT_ERRORS
+from .Latency import LatencyTracker
+from .Statistics import DeviceStatistics
 
 
 def notify_message(handler, interface_name, changed_properties, invalidated_properties):
@@ -24,16 +31,20 @@ FIDO_STATUS_UUID = "f1d0fff2-deaa-ecee-b42f-c9ba7ed623bb"
 FIDO_CONTROL_POINT_LENGTH_UUID = "f1d0fff3-deaa-ecee-b42f-c9ba7ed623bb"
 FIDO_SERVICE_REVISION_BITFIELD_UUID = "f1d0fff4-deaa-ecee-b42f-c9ba7ed623bb"
 
+# fidoServiceRevisionBitfield bits, in the order we select them
+SERVICE_REVISION_FIDO2 = 0x20
+SERVICE_REVISION_U2F_1_2 = 0x40
+SERVICE_REVISION_U2F_1_1 = 0x80
+SERVICE_REVISION_PREFERENCE = (SERVICE_REVISION_FIDO2, SERVICE_REVISION_U2F_1_2, SERVICE_REVISION_U2F_1_1)
+
+ATT_WRITE_HEADER_SIZE = 3  # opcode and handle, the rest of the ATT MTU carries the fragment
+
+# sent ahead of queued MSG and PING requests, see FrameScheduler
+CONTROL_COMMANDS = frozenset((CTAPBLE_CMD.CANCEL, CTAPBLE_CMD.ERROR, CTAPBLE_CMD.KEEPALIVE))
+
 
 async def find_characteristics(device_path, objects, characteristic_paths):
     # Iterate through objects to find the characteristic with the target UUID
-    if objects is None:
-        bus: MessageBus = await MessageBus(bus_type=BusType.SYSTEM).connect()
-        bluez_introspect = await bus.introspect("org.bluez", '/')
-        dbus_proxy = bus.get_proxy_object('org.bluez', '/', bluez_introspect)
-        # noinspection PyUnresolvedReferences
-        objects = await dbus_proxy.get_interface("org.freedesktop.DBus.ObjectManager").call_get_managed_objects()
-
     for path, interfaces in objects.items():
         if path.startswith(device_path):
             if "org.bluez.GattCharacteristic1" in interfaces:
@@ -43,6 +54,87 @@ async def find_characteristics(device_path, objects, characteristic_paths):
                     characteristic_paths[uuid] = path
 
 DEFAULT_TIMEOUT = 3000  # milliseconds
+DBUS_CALL_TIMEOUT = 5.0  # seconds, for any single call to bluetoothd
+TRANSACTION_TIMEOUT = 10.0  # seconds, for all BlueZ calls made while forwarding one CTAP request
+SERVICES_RESOLVED_TIMEOUT = 5.0  # seconds
+RECONNECT_BACKOFF_MIN = 0.1  # seconds
+RECONNECT_BACKOFF_MAX = 5.0  # seconds
+
+
+class ReconnectManager:
+    """Reconnects one device without polling.
+
+    Concurrent reconnect requests share a single in-flight attempt. Waiters are
+    woken by the Device1.Connected signal as soon as it arrives, and otherwise
+    retry with jittered exponential backoff.
+    """
+
+    def __init__(self, device: "CTAPBLEDevice"):
+        self.device = device
+        self.backoff = RECONNECT_BACKOFF_MIN
+        self._attempt: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+
+    def connection_changed(self, connected: bool):
+        if connected:
+            self.backoff = RECONNECT_BACKOFF_MIN
+            self._connected.set()
+        else:
+            self._connected.clear()
+
+    async def _run_attempt(self):
+        self.device.stats.reconnects += 1
+        await self.device.reconnect_attempt()
+        if not self.device.connected:
+            self.backoff = min(self.backoff * 2, RECONNECT_BACKOFF_MAX)
+
+    async def reconnect(self):
+        if self._attempt is None or self._attempt.done():
+            self._attempt = asyncio.create_task(self._run_attempt(), name=f"reconnect {self.device.device_id}")
+        # one waiter giving up must not cancel the attempt for the others
+        await asyncio.shield(self._attempt)
+
+    async def wait_connected(self):
+        """Reconnect until connected, bounded by the transaction deadline of the device."""
+        while not self.device.connected:
+            self.device.call_timeout()  # raises once the transaction deadline has passed
+            await self.reconnect()
+            if self.device.connected:
+                break
+            delay = self.backoff * random.uniform(0.5, 1.0)
+            try:
+                await asyncio.wait_for(self._connected.wait(), min(delay, self.device.call_timeout()))
+            except asyncio.TimeoutError:
+                pass
+
+class ConnectProfile:
+    """Duration in seconds of each step of the most recent connect, a full one or a reconnect."""
+
+    def __init__(self):
+        self.connects = 0
+        self.steps: dict[str, float] = {}
+        self.total = 0.0
+        self._started = 0.0
+
+    def start(self):
+        self.connects += 1
+        self.steps = {}
+        self._started = time.monotonic()
+
+    async def timed(self, step: str, awaitable):
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.steps[step] = time.monotonic() - started
+
+    def finish(self):
+        self.total = time.monotonic() - self._started
+
+    def __str__(self):
+        steps = " ".join(f"{step}={duration * 1000:.0f}ms" for step, duration in self.steps.items())
+        return f"total={self.total * 1000:.0f}ms {steps}"
+
 
 class CTAPBLEDevice:
     device1_interface: ProxyInterface  # org.bluez.Device1
@@ -50,19 +142,27 @@ class CTAPBLEDevice:
     connected = False
     timeout = DEFAULT_TIMEOUT
     cached = False
+    transaction_deadline: Optional[float] = None  # loop time, set while a CTAP request is forwarded
 
     fido_control_point_path: str
-    fido_control_point: ProxyInterface  # org.bluez.GattCharacteristic1
+    fido_control_point: Optional[ProxyInterface] = None  # org.bluez.GattCharacteristic1
     fido_control_point_length_path: str
     fido_status_path: str
-    fido_status: ProxyInterface  # org.bluez.GattCharacteristic1
-    fido_status_notify_listen: ProxyInterface  # org.freedesktop.DBus.Properties at fido status path
-    max_msg_size: int
+    fido_status: Optional[ProxyInterface] = None  # org.bluez.GattCharacteristic1
+    fido_status_notify_listen: Optional[ProxyInterface] = None  # org.freedesktop.DBus.Properties at fido status path
+    fido_service_revision_path: Optional[str]  # optional characteristic, U2F 1.0 devices lack it
+    fido_service_revision: Optional[ProxyInterface] = None  # org.bluez.GattCharacteristic1
+    service_revision = 0  # the revision selected on the device, 0 if none was
+    gatt_bus: Optional[MessageBus] = None  # the bus the characteristic proxies were made on
+    mtu = 0  # negotiated ATT MTU, 0 while unknown
+    max_msg_size: int  # fragment size, 0 until the first connect completed
     handler = None
     device_properties_interface: ProxyInterface  # org.freedesktop.DBus.Properties at device top level
     properties_changed_listener_active: bool = False  # Flag to track if listener is active
+    notify_listener_active: bool = False  # whether self.handler is registered for status notifications
 
-    def __init__(self, device_proxy, device1: ProxyInterface, device_id: str, cached: bool, control_point_path, control_point_length_path, status_path):
+    def __init__(self, device_proxy, device1: ProxyInterface, device_id: str, cached: bool, control_point_path, control_point_length_path, status_path,
+                 service_revision_path: Optional[str] = None, gatt_cache: Optional[GattCache] = None, snapshot: Optional[dict] = None):
         self.device_proxy = device_proxy
         self.device1_interface = device1
         self.device_id = device_id
@@ -71,7 +171,21 @@ class CTAPBLEDevice:
         self.fido_control_point_path = control_point_path
         self.fido_control_point_length_path = control_point_length_path
         self.fido_status_path = status_path
+        self.fido_service_revision_path = service_revision_path
         self.connected = False
+        self.reconnects = ReconnectManager(self)
+        self.connect_profile = ConnectProfile()
+        self.stats = DeviceStatistics()
+        self.latency = LatencyTracker()
+        self.scheduler = FrameScheduler(f"{device_id} control point")
+        self.services_resolved = asyncio.Event()
+        self.gatt_cache = gatt_cache or GattCache(None)
+        # introspection XML by object path and the control point length, both persisted in the GATT cache
+        self.introspection: dict[str, str] = dict(snapshot["introspection"]) if snapshot else {}
+        self.known_control_point_length: int = snapshot["control_point_length"] if snapshot else 0
+        self.known_service_revisions: int = snapshot["service_revisions"] if snapshot else 0
+        if device_id not in self.introspection:
+            self.introspection[device_id] = device_proxy.introspection.tostring()
         self.device_properties_interface = self.device_proxy.get_interface('org.freedesktop.DBus.Properties')
 
     async def connect(self, handler):
@@ -81,54 +195,7 @@ class CTAPBLEDevice:
         self.setup_signal_handler()
         if self.max_msg_size == 0:  # If we know Max Msg we have done this at least once. Don't want to redo it
             self.handler = partial(notify_message, handler)
-            bus: MessageBus = await MessageBus(bus_type=BusType.SYSTEM).connect()
-            logging.debug(f"Attempting to connect to {self.device_id}")
-            # noinspection PyUnresolvedReferences
-            await self.device1_interface.call_connect()
-
-            # If the OS lacked data on this before we need to re-fetch data and reconnect but has to be a better way somehow
-            if not self.cached:
-                # noinspection PyUnresolvedReferences
-                await self.device1_interface.call_disconnect()
-                device_introspect = await bus.introspect('org.bluez', self.device_id)
-                self.device_proxy = bus.get_proxy_object('org.bluez', self.device_id, device_introspect)
-                self.device1_interface = self.device_proxy.get_interface('org.bluez.Device1')
-                self.cached = True
-                # noinspection PyUnresolvedReferences
-                await self.device1_interface.call_connect()
-
-            if self.fido_control_point_path is None or self.fido_control_point_length_path is None or self.fido_status_path is None:
-                characteristic_paths = {
-                    FIDO_CONTROL_POINT_UUID: None,
-                    FIDO_CONTROL_POINT_LENGTH_UUID: None,
-                    FIDO_STATUS_UUID: None,
-                }
-                await find_characteristics(self.device_id, None, characteristic_paths)
-                self.fido_control_point_path = characteristic_paths[FIDO_CONTROL_POINT_UUID]
-                self.fido_control_point_length_path = characteristic_paths[FIDO_CONTROL_POINT_LENGTH_UUID]
-                self.fido_status_path = characteristic_paths[FIDO_STATUS_UUID]
-
-            control_point_length_proxy = bus.get_proxy_object('org.bluez', self.fido_control_point_length_path,
-                                                              await bus.introspect('org.bluez', self.fido_control_point_length_path))
-            control_point_length = control_point_length_proxy.get_interface('org.bluez.GattCharacteristic1')
-
-            status_proxy = bus.get_proxy_object('org.bluez', self.fido_status_path,
-                                                await bus.introspect('org.bluez', self.fido_status_path))
-            status_characteristic = status_proxy.get_interface('org.bluez.GattCharacteristic1')
-            notify_properties = status_proxy.get_interface('org.freedesktop.DBus.Properties')
-
-            control_point_proxy = bus.get_proxy_object('org.bluez', self.fido_control_point_path,
-                                                       await bus.introspect('org.bluez', self.fido_control_point_path))
-            control_point = control_point_proxy.get_interface('org.bluez.GattCharacteristic1')
-            # noinspection PyUnresolvedReferences
-            self.max_msg_size = int.from_bytes(bytes(await control_point_length.call_read_value({})), "big")
-            logging.debug(f"size: {self.max_msg_size}")
-
-            self.fido_control_point = control_point
-            self.fido_status = status_characteristic
-            self.fido_status_notify_listen = notify_properties
-            self.connected=True
-            await self.listen_to_notify()
+            await self.discover()
         else:
             logging.debug(f"Device previously connected: {self.device_id}")
             await self.reconnect()
@@ -137,63 +204,330 @@ class CTAPBLEDevice:
         logging.debug(f"Connection complete: {self.device_id}")
         return self
 
+    async def discover(self):
+        """Connect and build the characteristic proxies, finding the characteristics first if their paths are unknown."""
+        profile = self.connect_profile
+        profile.start()
+        logging.debug(f"Attempting to connect to {self.device_id}")
+        self.release_gatt_bus()
+        bus = self.gatt_bus = MessageBus(bus_type=BusType.SYSTEM)
+        try:
+            await self.discover_on(bus, profile)
+        except BaseException:
+            # a failed attempt must not leave its bus or notify handler behind for the retry
+            self.release_gatt_bus()
+            raise
+        # only set once everything succeeded, a failed connect is retried from scratch
+        self.max_msg_size = self.fragment_size()
+        self.set_connected(True)
+        self.save_gatt_cache()
+        profile.finish()
+        logging.info(f"Connected to {self.device_id}: {profile}")
+
+    async def discover_on(self, bus: MessageBus, profile: ConnectProfile):
+        # the bus for the characteristic proxies does not depend on the radio connection
+        await asyncio.gather(
+            profile.timed("bus", bus.connect()),
+            # noinspection PyUnresolvedReferences
+            profile.timed("connect", self.device1_interface.call_connect(timeout=self.call_timeout())),
+        )
+
+        # If the OS lacked data on this before, the characteristics only show up once services are resolved
+        if not self.cached:
+            if not await profile.timed("services_resolved", self.wait_services_resolved()):
+                logging.warning(f"Services of {self.device_id} not resolved in time, reconnecting instead")
+                await profile.timed("reconnect_uncached", self.reconnect_uncached(bus))
+            self.cached = True
+
+        if self.fido_control_point_path is None or self.fido_control_point_length_path is None or self.fido_status_path is None:
+            await profile.timed("find_characteristics", self.find_characteristics(bus))
+
+        # only StartNotify needs the status proxy, everything else is independent
+        await asyncio.gather(
+            profile.timed("status", self.setup_status(bus)),
+            profile.timed("control_point", self.setup_control_point(bus)),
+            profile.timed("control_point_length", self.read_control_point_length(bus)),
+            profile.timed("service_revision", self.setup_service_revision(bus)),
+        )
+
+    async def reconnect_uncached(self, bus: MessageBus):
+        # noinspection PyUnresolvedReferences
+        await self.device1_interface.call_disconnect(timeout=self.call_timeout())
+        device_introspect = await self.introspect(bus, self.device_id, refresh=True)
+        # stays on the bus of the device, the characteristic bus is dropped with the layout
+        self.device_proxy = self.device_proxy.bus.get_proxy_object('org.bluez', self.device_id, device_introspect)
+        self.device1_interface = self.device_proxy.get_interface('org.bluez.Device1')
+        # noinspection PyUnresolvedReferences
+        await self.device1_interface.call_connect(timeout=self.call_timeout())
+
+    async def find_characteristics(self, bus: MessageBus):
+        characteristic_paths = {
+            FIDO_CONTROL_POINT_UUID: None,
+            FIDO_CONTROL_POINT_LENGTH_UUID: None,
+            FIDO_STATUS_UUID: None,
+            FIDO_SERVICE_REVISION_BITFIELD_UUID: None,
+        }
+        # on the bus of the characteristic proxies, a bus of its own would never be closed
+        objects = await bus.get_managed_objects('org.bluez', path_prefix=self.device_id + '/',
+                                                interfaces=("org.bluez.GattCharacteristic1",),
+                                                timeout=self.call_timeout())
+        await find_characteristics(self.device_id, objects, characteristic_paths)
+        self.fido_control_point_path = characteristic_paths[FIDO_CONTROL_POINT_UUID]
+        self.fido_control_point_length_path = characteristic_paths[FIDO_CONTROL_POINT_LENGTH_UUID]
+        self.fido_status_path = characteristic_paths[FIDO_STATUS_UUID]
+        self.fido_service_revision_path = characteristic_paths[FIDO_SERVICE_REVISION_BITFIELD_UUID]
+
+    async def setup_status(self, bus: MessageBus):
+        status_proxy = bus.get_proxy_object('org.bluez', self.fido_status_path,
+                                            await self.introspect(bus, self.fido_status_path))
+        self.fido_status = status_proxy.get_interface('org.bluez.GattCharacteristic1')
+        self.fido_status_notify_listen = status_proxy.get_interface('org.freedesktop.DBus.Properties')
+        self.start_listening()
+        # noinspection PyUnresolvedReferences
+        await self.fido_status.call_start_notify(timeout=self.call_timeout())
+
+    async def setup_control_point(self, bus: MessageBus):
+        control_point_proxy = bus.get_proxy_object('org.bluez', self.fido_control_point_path,
+                                                   await self.introspect(bus, self.fido_control_point_path))
+        self.fido_control_point = control_point_proxy.get_interface('org.bluez.GattCharacteristic1')
+        # BlueZ announces a renegotiated MTU on the characteristic
+        # noinspection PyUnresolvedReferences
+        control_point_proxy.get_interface('org.freedesktop.DBus.Properties').on_properties_changed(self.control_point_changed)
+        await self.read_mtu()
+
+    async def read_mtu(self):
+        # only BlueZ 5.62 and later export the MTU property
+        get_mtu = getattr(self.fido_control_point, "get_mtu", None)
+        if get_mtu is None:
+            return
+        try:
+            self.mtu = await get_mtu(timeout=self.call_timeout())
+        except DBusError as error:
+            logging.debug(f"Unable to read the MTU of {self.device_id}, error: {error}")
+
+    def control_point_changed(self, interface, changed, invalidated):
+        if interface == "org.bluez.GattCharacteristic1" and "MTU" in changed:
+            self.mtu = changed["MTU"].value
+            if self.max_msg_size:
+                self.max_msg_size = self.fragment_size()
+            logging.debug(f"MTU of {self.device_id} is now {self.mtu}, fragments of {self.max_msg_size} bytes")
+
+    def fragment_size(self) -> int:
+        """The control point length, capped so a fragment fits one ATT write."""
+        if self.mtu > ATT_WRITE_HEADER_SIZE:
+            return min(self.known_control_point_length, self.mtu - ATT_WRITE_HEADER_SIZE)
+        return self.known_control_point_length
+
+    async def setup_service_revision(self, bus: MessageBus):
+        if self.fido_service_revision_path is None:
+            return
+        service_revision_proxy = bus.get_proxy_object('org.bluez', self.fido_service_revision_path,
+                                                      await self.introspect(bus, self.fido_service_revision_path))
+        self.fido_service_revision = service_revision_proxy.get_interface('org.bluez.GattCharacteristic1')
+        if not self.known_service_revisions:
+            # noinspection PyUnresolvedReferences
+            value = await self.fido_service_revision.call_read_value({}, timeout=self.call_timeout())
+            self.known_service_revisions = value[0] if value else 0
+        await self.write_service_revision()
+
+    async def write_service_revision(self):
+        """Select the preferred revision the device supports, the choice only lasts for the connection."""
+        if self.fido_service_revision is None:
+            return
+        revision = next((revision for revision in SERVICE_REVISION_PREFERENCE if self.known_service_revisions & revision), 0)
+        if not revision:
+            return
+        try:
+            # noinspection PyUnresolvedReferences
+            await self.fido_service_revision.call_write_value(bytes([revision]), {}, timeout=self.call_timeout())
+        except DBusError as error:
+            logging.warning(f"Unable to select service revision 0x{revision:02x} on {self.device_id}, error: {error}")
+            self.gatt_error(error)
+            return
+        self.service_revision = revision
+        logging.debug(f"Selected service revision 0x{revision:02x} of 0x{self.known_service_revisions:02x} on {self.device_id}")
+
+    async def read_control_point_length(self, bus: MessageBus):
+        if not self.known_control_point_length:
+            control_point_length_proxy = bus.get_proxy_object('org.bluez', self.fido_control_point_length_path,
+                                                              await self.introspect(bus, self.fido_control_point_length_path))
+            control_point_length = control_point_length_proxy.get_interface('org.bluez.GattCharacteristic1')
+            # noinspection PyUnresolvedReferences
+            value = await control_point_length.call_read_value({}, timeout=self.call_timeout())
+            self.known_control_point_length = int.from_bytes(bytes(value), "big")
+        logging.debug(f"size: {self.known_control_point_length}")
+
+    async def introspect(self, bus: MessageBus, path: str, refresh: bool = False):
+        """Introspection data for ``path``, from the GATT cache unless ``refresh`` is set."""
+        if not refresh and path in self.introspection:
+            return self.introspection[path]
+        try:
+            node = await bus.introspect('org.bluez', path, timeout=self.call_timeout())
+        except DBusError as error:
+            self.gatt_error(error)
+            raise
+        self.introspection[path] = node.tostring()
+        return node
+
+    def save_gatt_cache(self):
+        self.gatt_cache.store(self.device_id, {
+            "characteristics": {
+                FIDO_CONTROL_POINT_UUID: self.fido_control_point_path,
+                FIDO_CONTROL_POINT_LENGTH_UUID: self.fido_control_point_length_path,
+                FIDO_STATUS_UUID: self.fido_status_path,
+                FIDO_SERVICE_REVISION_BITFIELD_UUID: self.fido_service_revision_path,
+            },
+            "control_point_length": self.known_control_point_length,
+            "service_revisions": self.known_service_revisions,
+            "introspection": self.introspection,
+        })
+
+    def invalidate_gatt_cache(self):
+        """Forget the persisted and the in-memory layout, the next connect discovers it again."""
+        self.gatt_cache.invalidate(self.device_id)
+        # the device object itself keeps its path, fido2ble.py builds its proxy from the snapshot
+        self.introspection = {self.device_id: self.device_proxy.introspection.tostring()}
+        self.known_control_point_length = 0
+        self.known_service_revisions = 0
+        self.fido_control_point_path = None
+        self.fido_control_point_length_path = None
+        self.fido_status_path = None
+        self.fido_service_revision_path = None
+        self.cached = False
+        self.max_msg_size = 0
+        self.service_revision = 0
+        self.release_gatt_bus()
+        # nothing can be written until discover has run again
+        self.set_connected(False)
+
+    def release_gatt_bus(self):
+        """Drop the characteristic proxies along with the bus they were made on."""
+        # a step of a failed discover that was still running may have registered the handler after the release
+        self.stop_listening()
+        bus, self.gatt_bus = self.gatt_bus, None
+        if bus is None:
+            return
+        bus.disconnect()
+        self.fido_control_point = None
+        self.fido_status = None
+        self.fido_status_notify_listen = None
+        self.fido_service_revision = None
+
+    def gatt_error(self, error: DBusError):
+        if error.type in STALE_LAYOUT_ERRORS:
+            logging.warning(f"GATT layout of {self.device_id} changed, error: {error}")
+            self.invalidate_gatt_cache()
+
+    async def wait_services_resolved(self) -> bool:
+        """Wait until BlueZ has resolved the GATT services of the connected device.
+
+        Returns False when that did not happen within SERVICES_RESOLVED_TIMEOUT."""
+        if self.services_resolved.is_set():
+            return True
+        try:
+            # the signal may have fired before we subscribed, so ask once
+            # noinspection PyUnresolvedReferences
+            if await self.device1_interface.get_services_resolved(timeout=self.call_timeout()):
+                self.services_resolved.set()
+                return True
+            await asyncio.wait_for(self.services_resolved.wait(), SERVICES_RESOLVED_TIMEOUT)
+        except (DBusError, asyncio.TimeoutError) as error:
+            logging.debug(f"Waiting for services of {self.device_id} failed, error: {error}")
+            return False
+        return True
+
     async def reconnect(self):
+        """Make one reconnect attempt, joining the one in flight if there is one."""
+        await self.reconnects.reconnect()
+
+    async def wait_connected(self):
+        await self.reconnects.wait_connected()
+
+    async def reconnect_attempt(self):
+        if not self.max_msg_size:
+            # the layout was invalidated, the old characteristic paths are gone
+            try:
+                await self.discover()
+            except Exception as error:
+                logging.warning(f"Unable to discover {self.device_id} again, error: {error}")
+            return
+        profile = self.connect_profile
+        profile.start()
         try:
             # noinspection PyUnresolvedReferences
-            await self.device1_interface.call_connect()
+            await profile.timed("connect", self.device1_interface.call_connect(timeout=self.call_timeout()))
         except Exception as error:
             logging.warning(f"Unable to reconnect to {self.device_id}, error: {error}")
-        try:
-            await self.listen_to_notify()
-        except Exception as error:
-            logging.warning(f"Unable to listen to notify when reconnecting to {self.device_id}, error: {error}")
+        if self.connected:
+            # StartNotify and the service revision write only need the link, not each other
+            notify, revision = await asyncio.gather(
+                profile.timed("start_notify", self.listen_to_notify()),
+                profile.timed("service_revision", self.write_service_revision()),
+                return_exceptions=True,
+            )
+            if isinstance(notify, Exception):
+                logging.warning(f"Unable to listen to notify when reconnecting to {self.device_id}, error: {notify}")
+            if isinstance(revision, Exception):
+                logging.warning(f"Unable to select service revision when reconnecting to {self.device_id}, error: {revision}")
+        profile.finish()
+        if self.connected:
+            logging.info(f"Reconnected to {self.device_id}: {profile}")
 
     async def disconnect(self):
         if self.connected:
-            self.connected = False #Has to be here to avoid sending messages while waiting for disconnect to finish
+            self.set_connected(False)  # Has to be here to avoid sending messages while waiting for disconnect to finish
             logging.debug(f"Disconnecting: {self.device_id}")
             # noinspection PyUnresolvedReferences
-            await self.fido_status.call_stop_notify()
+            await self.fido_status.call_stop_notify(timeout=self.call_timeout())
             # noinspection PyUnresolvedReferences
-            await self.device1_interface.call_disconnect()
-        # noinspection PyUnresolvedReferences
-        self.fido_status_notify_listen.off_properties_changed(self.handler)
+            await self.device1_interface.call_disconnect(timeout=self.call_timeout())
+        self.stop_listening()
 
     async def write_data(self, payload: bytes):
         try:
-            while not self.connected:
+            if not self.connected:
                 logging.debug("Waiting to connect")
-                await self.reconnect()
+                await self.wait_connected()
             # noinspection PyUnresolvedReferences
-            await self.fido_control_point.call_write_value(payload, {})
+            await self.fido_control_point.call_write_value(payload, {}, timeout=self.call_timeout())
         except DBusError as error:
             logging.error(f"Unable to write to {self.device_id}, error: {error}")
+            self.gatt_error(error)
 
     async def listen_to_notify(self):
         if self.connected:
+            self.start_listening()
             # noinspection PyUnresolvedReferences
-            self.fido_status_notify_listen.on_properties_changed(self.handler)
-            # noinspection PyUnresolvedReferences
-            await self.fido_status.call_start_notify()
+            await self.fido_status.call_start_notify(timeout=self.call_timeout())
 
     async def send_ble_message(self, command: CTAPBLE_CMD, payload: bytes):
         logging.debug(f"ble tx: command={command.name} device={self.device_id} payload={payload.hex()}")
-        offset_start = 0
-        seq = 0
         self.keep_alive()
-        while offset_start < len(payload) or offset_start == 0:
-            if seq == 0:
-                capacity = self.max_msg_size - 3
-                response = struct.pack(">BH", 0x80 | command, len(payload))
-            else:
-                capacity = self.max_msg_size - 1
-                response = struct.pack(">B", seq - 1)
-            response += payload[offset_start: (offset_start + capacity)]
-
-            await self.write_data(response)
+        stats = self.stats
+        stats.ble_messages_sent += 1
+        stats.ble_bytes_sent += len(payload)
+        latency = self.latency
+        latency.write_started()
+        await self.scheduler.send(ble_fragments(command, payload, self.max_msg_size), self.write_fragment,
+                                  control=command in CONTROL_COMMANDS)
+        latency.write_finished()
+
+    async def write_fragment(self, fragment: bytes):
+        await self.write_data(fragment)
+        self.stats.ble_fragments_sent += 1
+
+    def start_listening(self):
+        """Deliver status notifications to self.handler, registering it at most once."""
+        if not self.notify_listener_active:
+            # noinspection PyUnresolvedReferences
+            self.fido_status_notify_listen.on_properties_changed(self.handler)
+            self.notify_listener_active = True
 
-            offset_start += capacity
-            seq += 1
+    def stop_listening(self):
+        if self.notify_listener_active:
+            # noinspection PyUnresolvedReferences
+            self.fido_status_notify_listen.off_properties_changed(self.handler)
+            self.notify_listener_active = False
 
     def get_connected_ble(self):
         if self.connected:
@@ -201,14 +535,62 @@ class CTAPBLEDevice:
 
         return None
 
+    def set_connected(self, connected: bool):
+        self.connected = connected
+        self.reconnects.connection_changed(connected)
+
     def keep_alive(self):
         self.timeout = DEFAULT_TIMEOUT
 
+    def start_transaction(self):
+        self.transaction_deadline = asyncio.get_running_loop().time() + TRANSACTION_TIMEOUT
+
+    def end_transaction(self):
+        self.transaction_deadline = None
+
+    def state(self) -> dict:
+        """Snapshot of the connection state for diagnostics."""
+        loop = asyncio.get_running_loop()
+        return {
+            "connected": self.connected,
+            "services_resolved": self.services_resolved.is_set(),
+            "cached": self.cached,
+            "max_msg_size": self.max_msg_size,
+            "mtu": self.mtu,
+            "service_revision": self.service_revision,
+            "idle_timeout_ms": self.timeout,
+            "transaction_remaining": None if self.transaction_deadline is None else self.transaction_deadline - loop.time(),
+            "reconnect_backoff": self.reconnects.backoff,
+            "latency_command": self.latency.command,
+            # the only way to read them with --workers, which does not export the control service
+            "latency": self.latency.summary(),
+            "scheduler": self.scheduler.stats(),
+            "counters": self.stats.as_dict(),
+        }
+
+    def call_timeout(self) -> float:
+        """Seconds the next BlueZ call may take, bounded by the deadline of the current transaction."""
+        if self.transaction_deadline is None:
+            return DBUS_CALL_TIMEOUT
+        remaining = self.transaction_deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError(f"Transaction deadline passed for {self.device_id}")
+        return min(DBUS_CALL_TIMEOUT, remaining)
+
     def properties_changed(self, interface, changed, invalidated):
         """Handles PropertiesChanged signal to update the connection state."""
         if interface == "org.bluez.Device1" and "Connected" in changed:
-            self.connected = bool(changed["Connected"].value)
+            # a link without characteristic proxies is not usable until discover has run
+            self.set_connected(bool(changed["Connected"].value) and self.max_msg_size != 0)
             logging.info(f"Device {self.device_id} connection status updated: {self.connected}")
+        if interface == "org.bluez.Device1" and "ServicesResolved" in changed:
+            if changed["ServicesResolved"].value:
+                self.services_resolved.set()
+                return
+            self.services_resolved.clear()
+            # BlueZ drops resolved services on a link that stays up when the device reports a service change
+            if self.connected:
+                self.invalidate_gatt_cache()
 
     def setup_signal_handler(self):
         """Attach signal handler to listen for connection status changes."""
@@ -0,0 +1,188 @@
+"""Fragmentation and reassembly shared by the CTAPHID and CTAPBLE transports.
+
+Both transports split a message into an initialization frame carrying the
+command and the total length, followed by continuation frames carrying a
+sequence number. CTAPHID additionally prefixes every frame with a 4 byte
+channel id and pads frames to the fixed report size.
+
+See: https://fidoalliance.org/specs/fido-v2.1-rd-20210309/fido-client-to-authenticator-protocol-v2.1-rd-20210309.html#usb-message-and-packet-structure
+and https://fidoalliance.org/specs/fido-v2.1-rd-20210309/fido-client-to-authenticator-protocol-v2.1-rd-20210309.html#ble-framing
+"""
+import struct
+from typing import Iterable, Iterator, Optional
+
+HID_INIT_HEADER = struct.Struct(">IBH")
+HID_CONT_HEADER = struct.Struct(">IB")
+BLE_INIT_HEADER = struct.Struct(">BH")
+BLE_CONT_HEADER = struct.Struct(">B")
+
+# Frames handed to the reassembler have the channel already stripped, so both
+# transports share the same layout from here on.
+_FRAME_INIT_HEADER = BLE_INIT_HEADER
+_FRAME_CONT_HEADER = BLE_CONT_HEADER
+
+HID_PACKET_SIZE = 64
+HID_MAX_SEQ = 0x7F
+HID_MAX_MESSAGE_SIZE = (HID_PACKET_SIZE - HID_INIT_HEADER.size) + (HID_MAX_SEQ + 1) * (HID_PACKET_SIZE - HID_CONT_HEADER.size)
+
+
+class FramingError(ValueError):
+    """Raised when an incoming frame does not fit the message being reassembled."""
+
+
+def _fragments(payload, first_capacity: int, capacity: int) -> Iterator[tuple[int, memoryview]]:
+    """Yield ``(seq, chunk)`` pairs, seq being -1 for the initialization frame.
+
+    An empty payload still produces the initialization frame."""
+    view = memoryview(payload)
+    length = len(view)
+    yield -1, view[:first_capacity]
+    offset = first_capacity
+    seq = 0
+    while offset < length:
+        yield seq, view[offset: offset + capacity]
+        offset += capacity
+        seq += 1
+
+
+def hid_fragments(channel: int, command: int, payload, packet_size: int = HID_PACKET_SIZE) -> Iterator[bytearray]:
+    """Split ``payload`` into zero padded CTAPHID reports of ``packet_size`` bytes.
+
+    Every report is written into the same buffer, which the next one
+    overwrites. Consumers have to send a report before advancing, and copy it
+    to keep it."""
+    if len(payload) > HID_MAX_MESSAGE_SIZE:
+        raise FramingError(f"payload of {len(payload)} bytes exceeds CTAPHID maximum of {HID_MAX_MESSAGE_SIZE}")
+    init_start = HID_INIT_HEADER.size
+    cont_start = HID_CONT_HEADER.size
+    length = len(payload)
+    frame = bytearray(packet_size)
+    for seq, chunk in _fragments(payload, packet_size - init_start, packet_size - cont_start):
+        if seq < 0:
+            HID_INIT_HEADER.pack_into(frame, 0, channel, 0x80 | command, length)
+            start = init_start
+        else:
+            HID_CONT_HEADER.pack_into(frame, 0, channel, seq)
+            start = cont_start
+        end = start + len(chunk)
+        frame[start:end] = chunk
+        if seq >= 0 and end < packet_size:
+            # the last continuation frame, pad over what the previous one left behind
+            frame[end:] = bytes(packet_size - end)
+        yield frame
+
+
+def ble_fragments(command: int, payload, max_fragment_size: int) -> Iterator[bytearray]:
+    """Split ``payload`` into CTAPBLE fragments of at most ``max_fragment_size`` bytes.
+
+    ``command`` already carries the high bit, as the CTAPBLE command constants do.
+    As with hid_fragments, all fragments share one buffer."""
+    init_start = BLE_INIT_HEADER.size
+    cont_start = BLE_CONT_HEADER.size
+    if max_fragment_size <= init_start:
+        raise FramingError(f"fragment size of {max_fragment_size} bytes leaves no room for payload")
+    length = len(payload)
+    # only the last fragment is shorter than the first
+    frame = bytearray(min(max_fragment_size, init_start + length))
+    for seq, chunk in _fragments(payload, max_fragment_size - init_start, max_fragment_size - cont_start):
+        if seq < 0:
+            BLE_INIT_HEADER.pack_into(frame, 0, 0x80 | command, length)
+            start = init_start
+        else:
+            BLE_CONT_HEADER.pack_into(frame, 0, seq & 0x7F)
+            start = cont_start
+        end = start + len(chunk)
+        if end < len(frame):
+            del frame[end:]
+        frame[start:end] = chunk
+        yield frame
+
+
+class Reassembler:
+    """Incrementally rebuilds a message from frames without a channel prefix.
+
+    The payload is written into a buffer preallocated from the length in the
+    initialization frame. ``feed`` returns the completed payload once the last
+    byte has arrived, and ``None`` while more frames are expected. The command
+    byte is kept raw, callers mask it as their transport requires.
+    """
+
+    __slots__ = ("command", "total_length", "seq", "check_sequence", "_buffer", "_view", "_filled")
+
+    def __init__(self, check_sequence: bool = True):
+        self.check_sequence = check_sequence
+        self.reset()
+
+    def reset(self) -> None:
+        self.command = 0
+        self.total_length = 0
+        self.seq = -1
+        self._buffer = bytearray()
+        self._view = memoryview(self._buffer)
+        self._filled = 0
+
+    @property
+    def in_progress(self) -> bool:
+        return self._filled < self.total_length
+
+    def feed(self, frame) -> Optional[bytearray]:
+        cmd_or_seq = frame[0]
+        if cmd_or_seq & 0x80:
+            (self.total_length,) = struct.unpack_from(">H", frame, 1)
+            self.command = cmd_or_seq
+            self.seq = -1
+            self._buffer = bytearray(self.total_length)
+            self._view = memoryview(self._buffer)
+            self._filled = 0
+            start = _FRAME_INIT_HEADER.size
+        else:
+            if self.check_sequence and cmd_or_seq != self.seq + 1:
+                raise FramingError(f"Sequence out of order, expected {self.seq + 1} got {cmd_or_seq}")
+            if not self.in_progress:
+                raise FramingError(f"Unexpected continuation frame with sequence {cmd_or_seq}")
+            self.seq = cmd_or_seq
+            start = _FRAME_CONT_HEADER.size
+
+        take = min(len(frame) - start, self.total_length - self._filled)
+        if take > 0:
+            self._view[self._filled: self._filled + take] = memoryview(frame)[start: start + take]
+            self._filled += take
+        if self._filled == self.total_length:
+            payload = self._buffer
+            self._buffer = bytearray()
+            self._view = memoryview(self._buffer)
+            # leave total_length in place so a stray continuation is reported
+            return payload
+        return None
+
+
+def reassemble(frames: Iterable, check_sequence: bool = True) -> Iterator[tuple[int, bytearray]]:
+    """Yield ``(command, payload)`` for every message completed by ``frames``."""
+    reassembler = Reassembler(check_sequence)
+    for frame in frames:
+        payload = reassembler.feed(frame)
+        if payload is not None:
+            yield reassembler.command, payload
+
+
+def _benchmark() -> None:
+    import timeit
+    from collections import deque
+
+    for length in (0, 57, 58, 1024, HID_MAX_MESSAGE_SIZE):
+        payload = bytes(range(256)) * (length // 256) + bytes(length % 256)
+        hid_frames = [frame[4:] for frame in hid_fragments(1, 0x10, payload)]
+        ble_frames = [bytes(frame) for frame in ble_fragments(0x83, payload, 128)]
+        results = {
+            "hid_fragments": lambda: deque(hid_fragments(1, 0x10, payload), 0),
+            "hid_reassemble": lambda: list(reassemble(hid_frames)),
+            "ble_fragments": lambda: deque(ble_fragments(0x83, payload, 128), 0),
+            "ble_reassemble": lambda: list(reassemble(ble_frames, check_sequence=False)),
+        }
+        for name, fn in results.items():
+            number, total = timeit.Timer(fn).autorange()
+            print(f"{name:>15} {length:>5} bytes: {total / number * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    _benchmark()
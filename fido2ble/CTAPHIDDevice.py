@@ -2,45 +2,72 @@ import asyncio
 import logging
 import struct
 import sys
+import time
 from random import randint
 
 from .vendored import uhid
 from .vendored.dbus_fast import DBusError
 
-from .CMD import CTAPHID_CAPABILITIES, CTAPHID_CMD, CTAPBLE_CMD
+from . import RuntimeProfile
+from .CMD import CTAPHID_CAPABILITIES, CTAPHID_CMD, CTAPBLE_CMD, CTAP_STATUS
 from .CTAPBLEDevice import CTAPBLEDevice
+from .CTAPFraming import FramingError, Reassembler, hid_fragments
+from .FrameScheduler import FrameScheduler
+from .Latency import LatencyTracker, command_name
+from .MessageQueue import (BLE_HIGH_WATERMARK, BLE_LOW_WATERMARK, HID_HIGH_WATERMARK, HID_LOW_WATERMARK,
+                           MessageQueue)
+from .Statistics import DeviceStatistics
+from .TaskSupervisor import TaskSupervisor
 
 # noinspection SpellCheckingInspection
 CTAPHID_BROADCAST_CHANNEL = 0xFFFFFFFF
+# sent to the client ahead of queued responses of other tasks, see FrameScheduler
+HID_CONTROL_COMMANDS = frozenset((CTAPHID_CMD.CANCEL, CTAPHID_CMD.ERROR, CTAPHID_CMD.KEEPALIVE))
 
 
 class CTAPHIDDevice:
     device: uhid.UHIDDevice
     ble_device: CTAPBLEDevice
     channels_to_state: dict[int, bytes] = {}
-    active_tasks: list = []
+    active_tasks: TaskSupervisor
+    stats: DeviceStatistics
+    latency: LatencyTracker
     timeout_task = None
     active_channel: int
 
     hid_packet_size: int = 64
     channel: int = 0
-    hid_command: CTAPHID_CMD = CTAPHID_CMD.CANCEL
-    hid_buffer: bytes = b""
-    hid_total_length = 0
-    hid_seq = -1
+    hid_reassembler: Reassembler
+    hid_queue: MessageQueue
+    """Messages from the client waiting to be written to BLE, in order."""
+    hid_scheduler: FrameScheduler
+    """Input reports to the client, control messages first."""
+    hid_drain_task = None
 
     fidoControlPointLength: int = 60
-    ble_command: CTAPBLE_CMD = CTAPBLE_CMD.CANCEL
-    ble_buffer: bytes = b""
-    ble_total_length = 0
-    ble_seq = -1
+    ble_reassembler: Reassembler
+    ble_queue: MessageQueue
+    """Messages from the authenticator waiting to be sent to the client, in order."""
+    ble_drain_task = None
+
+    gc_paused = False
+    """Whether a request of this device holds off garbage collection, see RuntimeProfile."""
 
     reference_count = 0
     """Number of open handles to the device: clear state when it hits zero."""
 
-    def __init__(self, ble_device):
+    def __init__(self, ble_device, uhid_backend=uhid.AsyncioBlockingUHID):
         # This could then also include the proper name, VID, PID and so on
         self.ble_device = ble_device
+        self.active_tasks = TaskSupervisor(ble_device.device_id)
+        self.stats = ble_device.stats
+        self.latency = ble_device.latency
+        self.hid_reassembler = Reassembler()
+        # sequence numbers from the authenticator are not validated, as before
+        self.ble_reassembler = Reassembler(check_sequence=False)
+        self.hid_queue = MessageQueue(f"{ble_device.device_id} hid", HID_HIGH_WATERMARK, HID_LOW_WATERMARK)
+        self.ble_queue = MessageQueue(f"{ble_device.device_id} ble", BLE_HIGH_WATERMARK, BLE_LOW_WATERMARK)
+        self.hid_scheduler = FrameScheduler(f"{ble_device.device_id} uhid")
         addr = ble_device.device_id.split("_")[1:]
         vid = int("".join(addr[0:2]), 16)
         pid = int("".join(addr[2:4]), 16)
@@ -86,19 +113,25 @@ class CTAPHIDDevice:
                     0x02,  # Output (Data,Var,Abs,No Wrap,Linear,Preferred State,No Null Position,Non-volatile)
                     0xC0,  # End Collection
                 ],
-                backend=uhid.AsyncioBlockingUHID,
+                backend=uhid_backend,
                 physical_name="Test Device",
             )
         except PermissionError:
             print("Not enough permissions to access /dev/uhid. Rerun as root?")
             sys.exit(1)
 
+        self.started = asyncio.Event()
+        self.device.receive_start = self.process_start
         self.device.receive_open = self.process_open
         self.device.receive_close = self.process_close
         self.device.receive_output = self.process_process_hid_message
 
     async def start(self):
-        await self.device.wait_for_start_asyncio()
+        """Wait for UHID_START, the hidraw node exists from then on."""
+        await self.started.wait()
+
+    def process_start(self, dev_flags: int):
+        self.started.set()
 
     def process_open(self):
         self.reference_count += 1
@@ -106,17 +139,37 @@ class CTAPHIDDevice:
     def process_close(self):
         self.reference_count -= 1
 
+    def state(self) -> dict:
+        """Snapshot of the bridging state for diagnostics."""
+        return {
+            "active_channel": f"0x{getattr(self, 'active_channel', 0):08x}",
+            "reference_count": self.reference_count,
+            "hid_reassembling": self.hid_reassembler.in_progress,
+            "ble_reassembling": self.ble_reassembler.in_progress,
+            "idle_timer": self.timeout_task is not None and not self.timeout_task.done(),
+            "gc_paused": self.gc_paused,
+            "tasks": self.active_tasks.stats(),
+            "hid_queue": self.hid_queue.stats(),
+            "ble_queue": self.ble_queue.stats(),
+            "hid_scheduler": self.hid_scheduler.stats(),
+            "ble": self.ble_device.state(),
+        }
+
     def process_process_hid_message(
             self, buffer: list[int], report_type: uhid._ReportType
     ) -> None:
         # output_report = buffer[0]
+        self.stats.hid_frames_received += 1
         received_data = bytes(buffer[1:])
         channel, cmd_or_seq = struct.unpack(">IB", received_data[0:5])
-        # continuation = cmd_or_seq & 0x80 != 0
+        initialization = cmd_or_seq & 0x80 != 0
         cmd_or_seq = cmd_or_seq & 0x7F
         try:
             if channel == CTAPHID_BROADCAST_CHANNEL and cmd_or_seq == CTAPHID_CMD.INIT:
-                self.active_tasks.append(asyncio.create_task(self.handle_init(channel, received_data[7: 7 + 8])))
+                self.active_tasks.spawn(self.handle_init(channel, received_data[7: 7 + 8]), name="handle_init")
+            elif initialization and cmd_or_seq == CTAPHID_CMD.CANCEL:
+                # never queued behind other work, see handle_cancel
+                self.handle_cancel(channel)
             else:
                 self.handle_hid_message(channel, received_data[4:])
         except BaseException as error:
@@ -127,7 +180,7 @@ class CTAPHIDDevice:
         # Block if there is an active channel???
         if channel == CTAPHID_BROADCAST_CHANNEL and len(buffer) == 8:
             # https://fidoalliance.org/specs/fido-v2.1-rd-20210309/fido-client-to-authenticator-protocol-v2.1-rd-20210309.html#usb-channels
-            new_channel = randint(1, CTAPHID_BROADCAST_CHANNEL - 1)
+            new_channel = self.allocate_channel()
 
             try:
                 await self.ble_device.connect(self.handle_ble_message)
@@ -135,7 +188,7 @@ class CTAPHIDDevice:
                 logging.warning(f"Unable to connect to {self.ble_device.device_id}, cancelled: {cancelError}")
                 # Failed to connect, we abort now
                 return
-            except DBusError as dbusError:
+            except (DBusError, asyncio.TimeoutError) as dbusError:
                 logging.warning(f"Unable to connect to {self.ble_device.device_id}, error: {dbusError}")
                 # Failed to connect, we abort now
                 return
@@ -158,13 +211,16 @@ class CTAPHIDDevice:
                 logging.warning(f"Unable to connect to {self.ble_device.device_id}, cancelled: {cancelError}")
                 # Failed to connect, we abort now
                 return
-            except DBusError as dbusError:
+            except (DBusError, asyncio.TimeoutError) as dbusError:
                 logging.warning(f"Unable to connect to {self.ble_device.device_id}, error: {dbusError}")
                 # Failed to connect, we abort now
                 return
             self.active_channel = channel
         self.setup_timeout()
 
+    def allocate_channel(self) -> int:
+        return randint(1, CTAPHID_BROADCAST_CHANNEL - 1)
+
     async def send_init_reply(self, nonce: bytes, channel: int):
         await self.send_hid_message(
             CTAPHID_CMD.INIT,
@@ -186,121 +242,181 @@ class CTAPHIDDevice:
         logging.debug(f"hid tx: command={command.name} payload={payload.hex()}")
         if channel is None:
             channel = self.channel
-        offset_start = 0
-        seq = 0
-        while offset_start < len(payload):
-            if seq == 0:
-                capacity = self.hid_packet_size - 7
-                response = struct.pack(">IBH", channel, 0x80 | command, len(payload))
-            else:
-                capacity = self.hid_packet_size - 5
-                response = struct.pack(">IB", channel, seq - 1)
-            response += payload[offset_start: (offset_start + capacity)]
-
-            response += b"\0" * (self.hid_packet_size - len(response))
-
-            self.device.send_input(response)
-
-            offset_start += capacity
-            seq += 1
+        stats = self.stats
+        stats.hid_messages_sent += 1
+        stats.hid_bytes_sent += len(payload)
+        await self.hid_scheduler.send(hid_fragments(channel, command, payload, self.hid_packet_size), self.send_report,
+                                      control=command in HID_CONTROL_COMMANDS)
+
+    async def send_report(self, frame: bytes):
+        self.device.send_input(frame)
+        self.stats.hid_frames_sent += 1
+        # a frame boundary: the loop gets to run, and a control message of another task goes next
+        await asyncio.sleep(0)
 
     def handle_hid_message(self, channel, payload_without_channel):
-        (cmd_or_seq,) = struct.unpack(">B", payload_without_channel[0:1])
-        continuation = cmd_or_seq & 0x80 == 0
-        cmd_or_seq = cmd_or_seq & 0x7F
-
-        if not continuation:
-            self.hid_command = CTAPHID_CMD(cmd_or_seq)
-            (self.hid_total_length,) = struct.unpack(">H", payload_without_channel[1:3])
-            self.hid_seq = -1
-            self.hid_buffer = payload_without_channel[3: 3 + self.hid_total_length]
-        else:
-            if cmd_or_seq != self.hid_seq + 1:
-                logging.error(f"Sequence out of order, expected {self.hid_seq + 1} got {cmd_or_seq}, payload={payload_without_channel.hex()}")
-                # there be dragons: CTAP_STATUS.CTAP1_ERR_INVALID_SEQ
+        try:
+            payload = self.hid_reassembler.feed(payload_without_channel)
+        except FramingError as error:
+            logging.error(f"{error}, payload={payload_without_channel.hex()}")
+            # there be dragons: CTAP_STATUS.CTAP1_ERR_INVALID_SEQ
+            return
+        if payload is not None:
+            self.stats.hid_messages_received += 1
+            self.stats.hid_bytes_received += len(payload)
+            command = CTAPHID_CMD(self.hid_reassembler.command & 0x7F)
+            if not self.hid_queue.put((channel, command, payload, time.perf_counter())):
+                logging.warning(f"{self.hid_queue.name} queue is full, {command.name} answered with BUSY")
+                self.active_tasks.spawn(self.send_error(channel, CTAP_STATUS.CTAP1_ERR_CHANNEL_BUSY),
+                                        name="hid_busy", bounded=False)
                 return
-            payload = payload_without_channel[1:]
-            remaining = self.hid_total_length - len(self.hid_buffer)
-            self.hid_buffer += payload[:remaining]
-            self.hid_seq = cmd_or_seq
-        if self.hid_total_length == len(self.hid_buffer):
-            self.active_tasks.append(asyncio.create_task(self.hid_finish_receiving(channel), name="hid_finish_receiving"))
-
-    async def hid_finish_receiving(self, channel):
+            if self.hid_drain_task is None or self.hid_drain_task.done():
+                # named after the work it does, check_timeout keeps it running across an idle disconnect
+                self.hid_drain_task = self.active_tasks.spawn(self.hid_drain(), name="hid_finish_receiving")
+
+    def handle_cancel(self, channel):
+        """Abort the request in flight right away.
+
+        Pending reassembly, queued messages and BlueZ calls are cancelled before
+        the BLE CANCEL is sent. A message already partly written is finished by
+        its FrameScheduler, the CANCEL goes out right after its last fragment
+        instead of waiting behind a reconnect or queued requests. CTAPHID does
+        not answer a CANCEL, the authenticator answers the cancelled request
+        instead.
+        """
+        logging.debug(f"hid cancel: channel={'%X' % channel} device={self.ble_device.device_id}")
+        self.hid_reassembler.reset()
+        self.hid_queue.clear()
+        # both drains are cancelled below, the next message of either side starts a new one
+        self.ble_queue.clear()
+        self.latency.abort()
+        self.resume_gc()
+        self.active_tasks.cancel()
+        self.hid_drain_task = None
+        self.ble_drain_task = None
+        if self.ble_device.get_connected_ble() is None:
+            # nothing can be in flight on the radio
+            return
+        self.active_tasks.spawn(self.ble_device.send_ble_message(CTAPBLE_CMD.CANCEL, b""), name="ble_cancel", bounded=False)
+
+    async def hid_drain(self):
+        """Write the queued client messages to BLE one after the other."""
+        queue = self.hid_queue
+        while queue:
+            await self.hid_finish_receiving(*queue.get())
+
+    async def hid_finish_receiving(self, channel: int, command: CTAPHID_CMD, payload: bytes, reassembled: float):
+        # timed from reassembly, so the wait in hid_queue counts towards bridge_in
+        # the first byte of a CBOR payload is the CTAP command
+        if command == CTAPHID_CMD.CBOR and payload:
+            self.latency.begin(command_name(payload[0]), reassembled)
+        else:
+            self.latency.begin(command.name.lower(), reassembled)
+        # held until the response has been forwarded, see resume_gc
+        self.pause_gc()
+        self.ble_device.start_transaction()
         try:
             connected_ble_device: CTAPBLEDevice = self.ble_device.get_connected_ble()
-            while connected_ble_device is None:
+            if connected_ble_device is None:
                 logging.debug("Reconnect to device")
-                try:
-                    await self.ble_device.reconnect()
-                except Exception as error:
-                    logging.warning(f"Reconnect failed: {error}")
-
-                await asyncio.sleep(1)  # Wait before retrying
-                connected_ble_device = self.ble_device.get_connected_ble()
+                await self.ble_device.wait_connected()
+                connected_ble_device = self.ble_device
             self.setup_timeout()
 
-            if self.hid_command == CTAPHID_CMD.CBOR:
-                await connected_ble_device.send_ble_message(CTAPBLE_CMD.MSG, self.hid_buffer)
-            elif self.hid_command == CTAPHID_CMD.CANCEL:
-                await connected_ble_device.send_ble_message(CTAPBLE_CMD.CANCEL, self.hid_buffer)
-                for task in self.active_tasks:
-                    if not task.done():
-                        task.cancel()
-                self.active_tasks = []
-            elif self.hid_command == CTAPHID_CMD.ERROR:
+            if command == CTAPHID_CMD.CBOR:
+                await connected_ble_device.send_ble_message(CTAPBLE_CMD.MSG, payload)
+            elif command == CTAPHID_CMD.ERROR:
                 # this should not happen, as the error is sent from the fido2 device via BLE, not from the relying party.
-                await connected_ble_device.send_ble_message(CTAPBLE_CMD.ERROR, self.hid_buffer)
-            elif self.hid_command == CTAPHID_CMD.PING:
-                await connected_ble_device.send_ble_message(CTAPBLE_CMD.PING, self.hid_buffer)
-            elif self.hid_command in (CTAPHID_CMD.INIT, CTAPHID_CMD.WINK, CTAPHID_CMD.MSG, CTAPHID_CMD.LOCK):
-                # TODO
-                pass
+                await connected_ble_device.send_ble_message(CTAPBLE_CMD.ERROR, payload)
+            elif command == CTAPHID_CMD.PING:
+                await connected_ble_device.send_ble_message(CTAPBLE_CMD.PING, payload)
+            elif command in (CTAPHID_CMD.INIT, CTAPHID_CMD.WINK, CTAPHID_CMD.MSG, CTAPHID_CMD.LOCK):
+                # TODO, nothing is sent so no response follows
+                self.resume_gc()
+        except asyncio.TimeoutError as error:
+            logging.warning(f"BlueZ timed out during hid_finish_receiving, error={error}")
+            self.stats.timeouts += 1
+            self.latency.abort()
+            self.resume_gc()
+            await self.send_error(channel, CTAP_STATUS.CTAP1_ERR_TIMEOUT)
         except Exception as error:
             logging.warning(f"Error during hid_finish_receiving, error={error}")
+            self.resume_gc()
+        finally:
+            self.ble_device.end_transaction()
+
+    def pause_gc(self):
+        if not self.gc_paused:
+            self.gc_paused = True
+            RuntimeProfile.transaction_started()
+
+    def resume_gc(self):
+        """Called once the response has been forwarded, or the request was given up."""
+        if self.gc_paused:
+            self.gc_paused = False
+            RuntimeProfile.transaction_finished()
+
+    async def send_error(self, channel: int, status: CTAP_STATUS):
+        await self.send_hid_message(CTAPHID_CMD.ERROR, bytes((status,)), channel=channel)
 
     def handle_ble_message(self, payload):
-        (cmd_or_seq,) = struct.unpack(">B", payload[0:1])
-        continuation = cmd_or_seq & 0x80 == 0
-        cmd_or_seq = cmd_or_seq  # no adding of & 0x7F, as the command definitions include 0x80 for some reason in BLE
-
-        if not continuation:
-            self.ble_command = CTAPBLE_CMD(cmd_or_seq)
-            (self.ble_total_length,) = struct.unpack(">H", payload[1:3])
-            self.ble_buffer = payload[3: 3 + self.ble_total_length]
-            self.ble_seq = -1
-        else:
-            payload = payload[1:]
-            # if cmd_or_seq != self.ble_seq + 1:
-            #     self.handle_cancel(channel)
-            #     self.send_error(channel, CTAP_STATUS.CTAP1_ERR_INVALID_SEQ)
-            #     return
-            remaining = self.ble_total_length - len(self.ble_buffer)
-            self.ble_buffer += payload[:remaining]
-            self.ble_seq = cmd_or_seq
-        if self.ble_total_length == len(self.ble_buffer):
-            self.active_tasks.append(asyncio.create_task(self.ble_finish_receiving()))
-
-    async def ble_finish_receiving(self):
-        logging.debug(f"ble rx: command={self.ble_command.name} payload={self.ble_buffer.hex()} device={self.ble_device.device_id}")
+        self.stats.ble_fragments_received += 1
+        try:
+            message = self.ble_reassembler.feed(payload)
+        except FramingError as error:
+            logging.warning(f"{error}, payload={bytes(payload).hex()}")
+            return
+        # keepalives arrive while the authenticator is still working, they are not part of the response
+        if self.ble_reassembler.command != CTAPBLE_CMD.KEEPALIVE:
+            self.latency.notification()
+        if message is not None:
+            self.stats.ble_messages_received += 1
+            self.stats.ble_bytes_received += len(message)
+            # no masking with 0x7F, as the command definitions include 0x80 for some reason in BLE
+            command = CTAPBLE_CMD(self.ble_reassembler.command)
+            if not self.ble_queue.put((command, message)):
+                if command == CTAPBLE_CMD.KEEPALIVE:
+                    # the next one is at most a few hundred milliseconds away
+                    return
+                logging.warning(f"{self.ble_queue.name} queue is full, {command.name} answered with BUSY")
+                self.latency.abort()
+                self.resume_gc()
+                self.active_tasks.spawn(self.send_error(self.channel, CTAP_STATUS.CTAP1_ERR_CHANNEL_BUSY),
+                                        name="ble_busy", bounded=False)
+                return
+            if command != CTAPBLE_CMD.KEEPALIVE:
+                self.latency.response_received()
+            if self.ble_drain_task is None or self.ble_drain_task.done():
+                self.ble_drain_task = self.active_tasks.spawn(self.ble_drain(), name="ble_finish_receiving")
+
+    async def ble_drain(self):
+        """Send the queued authenticator messages to the client one after the other."""
+        queue = self.ble_queue
+        while queue:
+            await self.ble_finish_receiving(*queue.get())
+
+    async def ble_finish_receiving(self, command: CTAPBLE_CMD, payload: bytes):
+        logging.debug(f"ble rx: command={command.name} payload={payload.hex()} device={self.ble_device.device_id}")
         self.ble_device.keep_alive()
-        if self.ble_command == CTAPBLE_CMD.MSG:
-            await self.send_hid_message(CTAPHID_CMD.CBOR, self.ble_buffer)
-        elif self.ble_command == CTAPBLE_CMD.KEEPALIVE:
-            await self.send_hid_message(CTAPHID_CMD.KEEPALIVE, self.ble_buffer)
-        elif self.ble_command == CTAPBLE_CMD.ERROR:
-            await self.send_hid_message(CTAPHID_CMD.ERROR, self.ble_buffer)
-        elif self.ble_command == CTAPBLE_CMD.PING:
-            await self.send_hid_message(CTAPHID_CMD.PING, self.ble_buffer)
-        elif self.ble_command == CTAPBLE_CMD.CANCEL:
+        if command == CTAPBLE_CMD.MSG:
+            await self.send_hid_message(CTAPHID_CMD.CBOR, payload)
+            self.latency.response_sent()
+            self.resume_gc()
+        elif command == CTAPBLE_CMD.KEEPALIVE:
+            await self.send_hid_message(CTAPHID_CMD.KEEPALIVE, payload)
+        elif command == CTAPBLE_CMD.ERROR:
+            await self.send_hid_message(CTAPHID_CMD.ERROR, payload)
+            self.latency.response_sent()
+            self.resume_gc()
+        elif command == CTAPBLE_CMD.PING:
+            await self.send_hid_message(CTAPHID_CMD.PING, payload)
+            self.latency.response_sent()
+            self.resume_gc()
+        elif command == CTAPBLE_CMD.CANCEL:
             # Unsure if this case can happen, the cancel command comes from the relying party, not from the FIDO device
-            await self.send_hid_message(CTAPHID_CMD.CANCEL, self.ble_buffer)
+            await self.send_hid_message(CTAPHID_CMD.CANCEL, payload)
         else:
             pass
-        self.ble_command = CTAPBLE_CMD.CANCEL
-        self.ble_total_length = 0
-        self.ble_buffer = bytes()
-        self.ble_seq = -1
 
     async def check_timeout(self):
         while self.ble_device.timeout > 0:
@@ -308,19 +424,16 @@ class CTAPHIDDevice:
             await asyncio.sleep(0.1)
 
         await self.ble_device.disconnect()
-        i = 0
-        while i < len(self.active_tasks):
-            task = self.active_tasks[i]
-            logging.debug(f"Task {task} is {task.done()}")
-            if isinstance(task, asyncio.Task) and "hid_finish_receiving" in task.get_name() and not task.done():
-                i += 1  # Only increment if we didn't remove an element
-            else:
-                try:
-                    task.cancel()
-                    self.active_tasks.pop(i)
-                except Exception as error:
-                    logging.warning(f"Error when cancelling task, error: {error} ")
+        # pending hid_finish_receiving tasks reconnect on their own, everything else is stale
+        self.active_tasks.cancel(keep=lambda task: task.get_name() == "hid_finish_receiving")
+        self.ble_queue.clear()
+        self.ble_drain_task = None
+        logging.debug(f"Tasks of {self.ble_device.device_id}: {self.active_tasks.stats()}")
         self.active_channel = 0
+        if self.hid_drain_task is None or self.hid_drain_task.done():
+            # an authenticator that never answered must not keep the collector off
+            self.resume_gc()
+        RuntimeProfile.idle()
 
     def setup_timeout(self):
         # Only create a new task if the previous one is completed
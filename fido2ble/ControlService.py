@@ -0,0 +1,85 @@
+from .vendored.dbus_fast import PropertyAccess
+from .vendored.dbus_fast.service import ServiceInterface, dbus_property, method
+
+CONTROL_BUS_NAME = "org.pone.Fido2Ble1"
+CONTROL_PATH = "/org/pone/Fido2Ble1"
+DEVICE_INTERFACE = "org.pone.Fido2Ble1.Device"
+
+
+def device_object_path(device_path: str) -> str:
+    """/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF is exported as /org/pone/Fido2Ble1/dev_AA_BB_CC_DD_EE_FF."""
+    return f"{CONTROL_PATH}/{device_path.rsplit('/', 1)[-1]}"
+
+
+class DeviceControlInterface(ServiceInterface):
+    """Statistics and control of one bridged authenticator, exported on the system bus.
+
+    Properties are only read when a client asks for them, nothing here runs on
+    the forwarding path.
+    """
+
+    def __init__(self, hid_device):
+        super().__init__(DEVICE_INTERFACE)
+        self.hid_device = hid_device
+        self.ble_device = hid_device.ble_device
+
+    @dbus_property(access=PropertyAccess.READ, name="DevicePath")
+    def device_path(self) -> "o":
+        return self.ble_device.device_id
+
+    @dbus_property(access=PropertyAccess.READ, name="State")
+    def state(self) -> "s":
+        if self.ble_device.connected:
+            return "connected"
+        if self.ble_device.transaction_deadline is not None:
+            return "connecting"
+        return "disconnected"
+
+    @dbus_property(access=PropertyAccess.READ, name="Counters")
+    def counters(self) -> "a{st}":
+        return self.ble_device.stats.as_dict()
+
+    @dbus_property(access=PropertyAccess.READ, name="Tasks")
+    def tasks(self) -> "a{st}":
+        return self.hid_device.active_tasks.stats()
+
+    @dbus_property(access=PropertyAccess.READ, name="Queues")
+    def queues(self) -> "a{st}":
+        hid_device = self.hid_device
+        counters = {f"hid_{key}": value for key, value in hid_device.hid_queue.stats().items()}
+        counters.update((f"ble_{key}", value) for key, value in hid_device.ble_queue.stats().items())
+        return counters
+
+    @dbus_property(access=PropertyAccess.READ, name="ConnectLatency")
+    def connect_latency(self) -> "d":
+        return self.ble_device.connect_profile.total
+
+    @dbus_property(access=PropertyAccess.READ, name="ConnectProfile")
+    def connect_profile(self) -> "a{sd}":
+        return dict(self.ble_device.connect_profile.steps)
+
+    @dbus_property(access=PropertyAccess.READ, name="Latency")
+    def latency(self) -> "a{s(tddd)}":
+        """Count, p50, p95 and p99 in seconds, keyed by "command/stage"."""
+        return {key: list(value) for key, value in self.ble_device.latency.summary().items()}
+
+    @dbus_property(access=PropertyAccess.READ, name="IdleTimerActive")
+    def idle_timer_active(self) -> "b":
+        timeout_task = self.hid_device.timeout_task
+        return timeout_task is not None and not timeout_task.done()
+
+    @dbus_property(access=PropertyAccess.READ, name="IdleTimeRemaining")
+    def idle_time_remaining(self) -> "i":
+        """Milliseconds until the idle disconnect."""
+        return max(self.ble_device.timeout, 0)
+
+    @method(name="Disconnect")
+    def disconnect(self):
+        """Does nothing if the authenticator is not connected."""
+        if not self.ble_device.connected or self.ble_device.fido_status is None:
+            return
+        self.hid_device.active_tasks.spawn(self.ble_device.disconnect(), name="force_disconnect", bounded=False)
+
+    @method(name="ResetCounters")
+    def reset_counters(self):
+        self.ble_device.stats.reset()
@@ -0,0 +1,91 @@
+"""Evidence capture on a running daemon, triggered by signals.
+
+SIGUSR1 starts a cProfile session, the next SIGUSR1 stops it and writes the
+pstats file to the diagnostics directory. SIGUSR2 takes a tracemalloc
+snapshot and logs the largest growth since the previous one, the first
+SIGUSR2 only starts tracing. SIGQUIT logs every asyncio task with its stack,
+the state of every bridged device and the D-Bus string cache counters.
+"""
+import asyncio
+import io
+import logging
+import os
+import signal
+import time
+from typing import Callable
+
+from .vendored.dbus_fast._private.unmarshaller import STRING_CACHE
+
+DEFAULT_DIAGNOSTICS_DIR = "/var/tmp"
+TRACEMALLOC_FRAMES = 25
+TOP_ALLOCATIONS = 20
+
+
+class Diagnostics:
+    def __init__(self, directory: str, devices: Callable[[], dict]):
+        """``devices`` returns the CTAPHIDDevice of every bridged device by object path."""
+        self.directory = directory
+        self.devices = devices
+        self.profiler = None
+        self.snapshot = None
+
+    def install(self, loop: asyncio.AbstractEventLoop):
+        loop.add_signal_handler(signal.SIGUSR1, self.toggle_profile)
+        loop.add_signal_handler(signal.SIGUSR2, self.memory_diff)
+        loop.add_signal_handler(signal.SIGQUIT, self.dump_state)
+
+    def _file(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"fido2ble-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.{suffix}")
+
+    def toggle_profile(self):
+        import cProfile
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            logging.warning("Profiling started, send SIGUSR1 again to stop")
+            return
+        self.profiler.disable()
+        profiler, self.profiler = self.profiler, None
+        path = self._file("pstats")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as error:
+            logging.warning(f"Unable to write profile to {path}, error: {error}")
+            return
+        logging.warning(f"Profile written to {path}")
+
+    def memory_diff(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.snapshot = self._take_snapshot()
+            logging.warning("Memory tracing started, send SIGUSR2 again for the growth since now")
+            return
+        snapshot = self._take_snapshot()
+        lines = [f"Memory growth since the previous snapshot, {tracemalloc.get_traced_memory()[0]} bytes traced:"]
+        for difference in snapshot.compare_to(self.snapshot, "traceback")[:TOP_ALLOCATIONS]:
+            lines.append(f"{difference.size_diff:+d} bytes in {difference.count_diff:+d} blocks")
+            lines.extend(f"    {line}" for line in difference.traceback.format(limit=3))
+        self.snapshot = snapshot
+        logging.warning("\n".join(lines))
+
+    @staticmethod
+    def _take_snapshot():
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    def dump_state(self):
+        current = asyncio.current_task()
+        lines = []
+        for task in asyncio.all_tasks():
+            if task is current:
+                continue
+            stack = io.StringIO()
+            task.print_stack(file=stack)
+            lines.append(stack.getvalue().rstrip())
+        for path, hid_device in self.devices().items():
+            lines.append(f"{path}: {hid_device.state()}")
+        lines.append(f"D-Bus string cache: {STRING_CACHE.stats()}")
+        logging.warning("\n".join(lines))
+
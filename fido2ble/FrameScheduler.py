@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable, Optional
+
+
+class FrameScheduler:
+    """Hands out the write side of one transport a message at a time, in two classes.
+
+    Framing forbids interleaving the fragments of two messages, so a message
+    holds the scheduler from its initialization frame to its last
+    continuation frame. When it is released, waiting control messages go out
+    before waiting bulk messages and each class stays in arrival order. A
+    control message therefore waits for at most the rest of the message being
+    written, never for the bulk messages queued behind it.
+
+    The frames of a message are written by a task of the scheduler. A sender
+    that is cancelled once the first frame was handed to ``write`` leaves that
+    task running to the last frame, so the other side never sees a truncated
+    message. A sender cancelled before that drops its message.
+    """
+
+    __slots__ = ("name", "control_sent", "bulk_sent", "overtaken", "completed_after_cancel", "longest_control_wait",
+                 "_busy", "_control", "_bulk", "_writer", "_frames_started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.control_sent = 0
+        self.bulk_sent = 0
+        self.overtaken = 0  # bulk messages a control message was sent ahead of
+        self.completed_after_cancel = 0  # messages finished by the scheduler after their sender was cancelled
+        self.longest_control_wait = 0.0
+        self._busy = False
+        self._control: deque[asyncio.Future] = deque()
+        self._bulk: deque[asyncio.Future] = deque()
+        self._writer: Optional[asyncio.Task] = None
+        self._frames_started = 0
+
+    async def _acquire(self, control: bool):
+        if not self._busy:
+            self._busy = True
+            return
+        waiters = self._control if control else self._bulk
+        bulk_ahead = len(self._bulk)
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # handed the scheduler right before being cancelled, pass it on
+                self._release()
+            elif waiter in waiters:
+                waiters.remove(waiter)
+            raise
+        if control:
+            # bulk messages only leave the front of the queue, the rest of those that were there are still waiting
+            self.overtaken += min(bulk_ahead, len(self._bulk))
+
+    def _release(self):
+        for waiters in (self._control, self._bulk):
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    # stays busy, ownership moves to the waiter
+                    waiter.set_result(None)
+                    return
+        self._busy = False
+
+    async def _write(self, frames: Iterable, write: Callable[[bytes], Awaitable]):
+        for frame in frames:
+            self._frames_started += 1
+            await write(frame)
+
+    def _writer_done(self, writer: asyncio.Task):
+        self._writer = None
+        # also runs for a writer cancelled before its first step, whose finally clauses never would
+        self._release()
+        if not writer.cancelled() and writer.exception() is not None:
+            logging.debug(f"Writing a message to {self.name} failed, error: {writer.exception()}")
+
+    async def send(self, frames: Iterable, write: Callable[[bytes], Awaitable], control: bool = False):
+        """Write all ``frames`` of one message with ``write``, without another message in between."""
+        started = time.perf_counter()
+        await self._acquire(control)
+        if control:
+            self.longest_control_wait = max(self.longest_control_wait, time.perf_counter() - started)
+        self._frames_started = 0
+        # the loop only keeps a weak reference to the writer, this one keeps it alive after a cancelled send
+        writer = self._writer = asyncio.ensure_future(self._write(frames, write))
+        writer.add_done_callback(self._writer_done)
+        try:
+            await asyncio.shield(writer)
+        except asyncio.CancelledError:
+            if writer.done():
+                raise
+            if self._frames_started:
+                self.completed_after_cancel += 1
+            else:
+                writer.cancel()
+            raise
+        if control:
+            self.control_sent += 1
+        else:
+            self.bulk_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "control_sent": self.control_sent,
+            "bulk_sent": self.bulk_sent,
+            "waiting_control": len(self._control),
+            "waiting_bulk": len(self._bulk),
+            "overtaken": self.overtaken,
+            "completed_after_cancel": self.completed_after_cancel,
+            "longest_control_wait": self.longest_control_wait,
+        }
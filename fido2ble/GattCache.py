@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+from typing import Optional
+
+DEFAULT_CACHE_DIR = "/var/cache/fido2ble"
+CACHE_VERSION = 2  # 2 added the service revision bitfield
+
+# D-Bus errors that mean the cached object paths no longer match what BlueZ exports
+STALE_LAYOUT_ERRORS = (
+    "org.freedesktop.DBus.Error.UnknownObject",
+    "org.freedesktop.DBus.Error.UnknownInterface",
+    "org.freedesktop.DBus.Error.UnknownMethod",
+)
+
+
+def address_from_path(device_path: str) -> str:
+    """Turn /org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF into AA:BB:CC:DD:EE:FF."""
+    return ":".join(device_path.rsplit("/", 1)[-1].split("_")[1:])
+
+
+class GattCache:
+    """Per-device snapshots of the FIDO GATT layout, stored as one JSON file per BD address.
+
+    A snapshot holds the device path it was taken from, the characteristic
+    paths keyed by UUID, the control point length, the supported service
+    revisions and the introspection XML of the objects we build proxies for.
+    Passing ``None`` as directory disables the cache.
+    """
+
+    def __init__(self, directory: Optional[str] = DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def _file(self, device_path: str) -> str:
+        return os.path.join(self.directory, address_from_path(device_path).replace(":", "") + ".json")
+
+    def load(self, device_path: str) -> Optional[dict]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._file(device_path)) as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logging.warning(f"Unable to read GATT cache for {device_path}, error: {error}")
+            return None
+        # the same address behind another adapter gets other object paths
+        if snapshot.get("version") != CACHE_VERSION or snapshot.get("device_path") != device_path:
+            return None
+        logging.debug(f"Loaded GATT cache for {device_path}")
+        return snapshot
+
+    def store(self, device_path: str, snapshot: dict):
+        if not self.directory:
+            return
+        snapshot = dict(snapshot, version=CACHE_VERSION, device_path=device_path)
+        path = self._file(device_path)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "w") as file:
+                json.dump(snapshot, file)
+            os.replace(path + ".tmp", path)
+        except OSError as error:
+            logging.warning(f"Unable to write GATT cache for {device_path}, error: {error}")
+
+    def invalidate(self, device_path: str):
+        if not self.directory:
+            return
+        try:
+            os.unlink(self._file(device_path))
+            logging.info(f"Invalidated GATT cache for {device_path}")
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            logging.warning(f"Unable to remove GATT cache for {device_path}, error: {error}")
@@ -0,0 +1,141 @@
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from .CMD import CTAPHID_CMD
+
+# Upper bounds in seconds of log-scale buckets, a factor sqrt(2) apart from 100 µs to about 100 s.
+# Anything slower lands in one overflow bucket past the last bound.
+BUCKET_BOUNDS = tuple(0.0001 * 2 ** (i / 2) for i in range(41))
+
+STAGES = (
+    "bridge_in",  # HID reassembly complete -> first BLE write
+    "ble_write",  # first BLE write -> last BLE write done
+    "authenticator",  # last BLE write done -> first notification
+    "ble_notify",  # first notification -> last notification
+    "bridge_out",  # last notification -> last HID frame sent
+    "total",  # HID reassembly complete -> last HID frame sent
+)
+BRIDGE_IN, BLE_WRITE, AUTHENTICATOR, BLE_NOTIFY, BRIDGE_OUT, TOTAL = range(len(STAGES))
+
+CTAP2_COMMANDS = {
+    0x01: "makeCredential",
+    0x02: "getAssertion",
+    0x04: "getInfo",
+    0x06: "clientPIN",
+    0x07: "reset",
+    0x08: "getNextAssertion",
+    0x09: "bioEnrollment",
+    0x0A: "credentialManagement",
+    0x0B: "selection",
+    0x0C: "largeBlobs",
+    0x0D: "config",
+    0x40: "bioEnrollmentPreview",
+    0x41: "credentialManagementPreview",
+}
+
+
+def command_name(command: int) -> str:
+    return CTAP2_COMMANDS.get(command) or f"0x{command:02x}"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, recording never allocates."""
+
+    __slots__ = ("counts", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile, infinity for the overflow bucket."""
+        if not self.count:
+            return 0.0
+        wanted = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else float("inf")
+        return float("inf")
+
+
+class LatencyTracker:
+    """Per-stage latency of the CTAP requests of one device, keyed by CTAP command.
+
+    Only one request is in flight per device, so its timestamps live in plain
+    attributes that are overwritten by the next request. The histograms of
+    every known command are allocated up front, recording a request looks up
+    its command once in ``begin``.
+    """
+
+    def __init__(self):
+        self.histograms: dict[str, tuple[Histogram, ...]] = {}
+        for command in (*CTAP2_COMMANDS.values(), *(command.name.lower() for command in CTAPHID_CMD)):
+            self._stages(command)
+        self.command: Optional[str] = None
+        self.current: tuple[Histogram, ...] = ()
+        self.reassembled = 0.0
+        self.first_write = 0.0
+        self.last_write = 0.0
+        self.first_notification = 0.0
+        self.last_notification = 0.0
+
+    def _stages(self, command: str) -> tuple[Histogram, ...]:
+        stages = self.histograms.get(command)
+        if stages is None:
+            stages = self.histograms[command] = tuple(Histogram() for _ in STAGES)
+        return stages
+
+    def begin(self, command: str, reassembled: float):
+        """Start timing ``command``, reassembled at ``reassembled`` in time.perf_counter() seconds."""
+        self.command = command
+        self.current = self._stages(command)
+        self.reassembled = reassembled
+        self.first_write = self.last_write = self.first_notification = self.last_notification = 0.0
+
+    def abort(self):
+        self.command = None
+
+    def write_started(self):
+        if self.command is not None and not self.first_write:
+            self.first_write = time.perf_counter()
+
+    def write_finished(self):
+        if self.command is not None:
+            self.last_write = time.perf_counter()
+
+    def notification(self):
+        if self.command is not None and not self.first_notification:
+            self.first_notification = time.perf_counter()
+
+    def response_received(self):
+        if self.command is not None:
+            self.last_notification = time.perf_counter()
+
+    def response_sent(self):
+        if self.command is None or not (self.first_write and self.last_notification):
+            return
+        sent = time.perf_counter()
+        stages = self.current
+        stages[BRIDGE_IN].record(self.first_write - self.reassembled)
+        stages[BLE_WRITE].record(self.last_write - self.first_write)
+        stages[AUTHENTICATOR].record(self.first_notification - self.last_write)
+        stages[BLE_NOTIFY].record(self.last_notification - self.first_notification)
+        stages[BRIDGE_OUT].record(sent - self.last_notification)
+        stages[TOTAL].record(sent - self.reassembled)
+        self.command = None
+
+    def summary(self) -> dict[str, tuple[int, float, float, float]]:
+        """``{"command/stage": (count, p50, p95, p99)}`` with latencies in seconds."""
+        return {
+            f"{command}/{stage}": (histogram.count, histogram.quantile(0.5), histogram.quantile(0.95), histogram.quantile(0.99))
+            for command, stages in sorted(self.histograms.items())
+            for stage, histogram in zip(STAGES, stages)
+            if histogram.count
+        }
@@ -0,0 +1,70 @@
+from collections import deque
+from typing import Any
+
+HID_HIGH_WATERMARK = 8
+HID_LOW_WATERMARK = 4
+BLE_HIGH_WATERMARK = 32
+BLE_LOW_WATERMARK = 16
+
+
+class MessageQueue:
+    """Bounded FIFO of the reassembled messages of one device and direction.
+
+    ``put`` refuses messages once ``high_watermark`` messages are waiting and
+    keeps refusing them until the consumer has drained the queue down to
+    ``low_watermark``, so a client writing faster than the other side reads is
+    turned away in bursts instead of on every other message. Messages are
+    only ever taken from the front, the order never changes.
+    """
+
+    __slots__ = ("name", "high_watermark", "low_watermark", "congested", "peak", "enqueued", "rejected",
+                 "congestions", "_items")
+
+    def __init__(self, name: str, high_watermark: int, low_watermark: int):
+        self.name = name
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.congested = False
+        self.peak = 0
+        self.enqueued = 0
+        self.rejected = 0
+        self.congestions = 0
+        self._items: deque = deque()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, item: Any) -> bool:
+        """Append ``item``, returns False if the queue is congested and the item was dropped."""
+        items = self._items
+        if self.congested or len(items) >= self.high_watermark:
+            if not self.congested:
+                self.congested = True
+                self.congestions += 1
+            self.rejected += 1
+            return False
+        items.append(item)
+        self.enqueued += 1
+        if len(items) > self.peak:
+            self.peak = len(items)
+        return True
+
+    def get(self) -> Any:
+        items = self._items
+        item = items.popleft()
+        if self.congested and len(items) <= self.low_watermark:
+            self.congested = False
+        return item
+
+    def clear(self) -> None:
+        self._items.clear()
+        self.congested = False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "depth": len(self._items),
+            "peak": self.peak,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "congestions": self.congestions,
+        }
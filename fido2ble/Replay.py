@@ -0,0 +1,366 @@
+"""Record the CTAP traffic of a bridged device and replay it without hardware.
+
+A trace is a JSON line per event, timestamped in seconds since recording
+started. ``hid_out`` are output reports from the client and ``ble_notify``
+are status notifications from the authenticator, the inputs of the bridge.
+``hid_in`` are input reports to the client and ``ble_write`` are control
+point writes, its outputs. ``max_msg_size`` records the control point length
+in effect for the writes that follow.
+
+Replaying drives the real CTAPHIDDevice and CTAPBLEDevice against in-process
+fakes of /dev/uhid and the BlueZ objects, either at the recorded pace or as
+fast as possible. Every input is fed once the outputs recorded before it have
+been produced. The outputs have to match the trace byte for byte, and the
+time from each input to the last output it caused is reported as the bridge
+overhead next to the same figure in the recording::
+
+    fido2ble --record-trace /var/tmp
+    python -m fido2ble.Replay /var/tmp/AABBCCDDEEFF-1234.jsonl --fast
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from functools import partial
+from typing import Optional
+
+from .vendored import uhid
+from .vendored.dbus_fast import Variant
+
+from .CTAPBLEDevice import CTAPBLEDevice, notify_message
+from .CTAPHIDDevice import CTAPHIDDevice, CTAPHID_BROADCAST_CHANNEL
+from .CMD import CTAPHID_CMD
+from .CTAPFraming import HID_INIT_HEADER
+from .GattCache import address_from_path
+
+INPUT_EVENTS = ("hid_out", "ble_notify")
+OUTPUT_EVENTS = ("hid_in", "ble_write")
+OUTPUT_TIMEOUT = 5.0  # seconds the replayed bridge may take for the outputs of one input
+
+
+class TraceRecorder:
+    """Appends the traffic of one device to a trace file."""
+
+    def __init__(self, path: str, device_path: str):
+        self.path = path
+        self.file = open(path, "w")
+        self.started = time.perf_counter()
+        self.max_msg_size = 0
+        self.write("device", device_path=device_path)
+
+    def write(self, event: str, data=None, **fields):
+        fields["t"] = round(time.perf_counter() - self.started, 6)
+        fields["event"] = event
+        if data is not None:
+            fields["data"] = bytes(data).hex()
+        self.file.write(json.dumps(fields) + "\n")
+        self.file.flush()
+
+    def attach(self, hid: CTAPHIDDevice):
+        """Wrap the entry and exit points of ``hid`` and its BLE device."""
+        device = hid.device
+        ble_device = hid.ble_device
+
+        receive_output = device.receive_output
+
+        def output_report(buffer, report_type):
+            self.write("hid_out", buffer)
+            return receive_output(buffer, report_type)
+
+        send_input = device.send_input
+
+        def input_report(data):
+            self.write("hid_in", data)
+            send_input(data)
+
+        handle_ble_message = hid.handle_ble_message
+
+        def notification(payload):
+            self.write("ble_notify", payload)
+            handle_ble_message(payload)
+
+        write_data = ble_device.write_data
+
+        async def control_point_write(payload: bytes):
+            if ble_device.max_msg_size != self.max_msg_size:
+                self.max_msg_size = ble_device.max_msg_size
+                self.write("max_msg_size", value=self.max_msg_size)
+            self.write("ble_write", payload)
+            await write_data(payload)
+
+        device.receive_output = output_report
+        device.send_input = input_report
+        hid.handle_ble_message = notification
+        ble_device.write_data = control_point_write
+
+
+def record(hid: CTAPHIDDevice, directory: str) -> Optional[TraceRecorder]:
+    device_path = hid.ble_device.device_id
+    path = os.path.join(directory, f"{address_from_path(device_path).replace(':', '')}-{os.getpid()}.jsonl")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        recorder = TraceRecorder(path, device_path)
+    except OSError as error:
+        logging.warning(f"Unable to record trace of {device_path} to {path}, error: {error}")
+        return None
+    recorder.attach(hid)
+    logging.info(f"Recording trace of {device_path} to {path}")
+    return recorder
+
+
+def load_trace(path: str) -> list[dict]:
+    with open(path) as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    for event in events:
+        if "data" in event:
+            event["data"] = bytes.fromhex(event["data"])
+    return events
+
+
+class FakeUHID:
+    """Stands in for the /dev/uhid backend of uhid.UHIDDevice."""
+
+    def __init__(self, replay: "Replay"):
+        self.replay = replay
+        self.receive_start = None
+        self.receive_open = None
+        self.receive_close = None
+        self.receive_output = None
+
+    def send_event(self, event_type, *args):
+        if event_type == uhid._EventType.UHID_CREATE2:
+            # the kernel answers UHID_CREATE2 with UHID_START once the hidraw node exists
+            asyncio.get_running_loop().call_soon(lambda: self.receive_start and self.receive_start(0))
+        elif event_type == uhid._EventType.UHID_INPUT2:
+            self.replay.produced("hid_in", args[0])
+
+
+class FakeProperties:
+    """org.freedesktop.DBus.Properties of one object, signals are emitted synchronously."""
+
+    def __init__(self):
+        self.handlers = []
+
+    def on_properties_changed(self, handler):
+        self.handlers.append(handler)
+
+    def off_properties_changed(self, handler):
+        if handler in self.handlers:
+            self.handlers.remove(handler)
+
+    def emit(self, interface: str, changed: dict):
+        for handler in list(self.handlers):
+            handler(interface, changed, [])
+
+
+class FakeDevice1:
+    def __init__(self, properties: FakeProperties):
+        self.properties = properties
+
+    async def call_connect(self, timeout=None):
+        self.properties.emit("org.bluez.Device1", {"Connected": Variant("b", True)})
+
+    async def call_disconnect(self, timeout=None):
+        self.properties.emit("org.bluez.Device1", {"Connected": Variant("b", False)})
+
+    async def get_services_resolved(self, timeout=None):
+        return True
+
+
+class FakeCharacteristic:
+    def __init__(self, replay: "Replay"):
+        self.replay = replay
+
+    async def call_write_value(self, value, options, timeout=None):
+        self.replay.produced("ble_write", value)
+
+    async def call_start_notify(self, timeout=None):
+        pass
+
+    async def call_stop_notify(self, timeout=None):
+        pass
+
+
+class FakeIntrospection:
+    def tostring(self) -> str:
+        return ""
+
+
+class FakeDeviceProxy:
+    def __init__(self, properties: FakeProperties):
+        self.introspection = FakeIntrospection()
+        self.properties = properties
+
+    def get_interface(self, name: str):
+        return self.properties
+
+
+class ReplayHIDDevice(CTAPHIDDevice):
+    """Hands out the channels the recorded session was given instead of random ones."""
+
+    def __init__(self, ble_device, replay: "Replay", channels: list[int]):
+        super().__init__(ble_device, uhid_backend=partial(FakeUHID, replay))
+        self.channels = channels
+
+    def allocate_channel(self) -> int:
+        return self.channels.pop(0) if self.channels else super().allocate_channel()
+
+
+def allocated_channels(events: list[dict]) -> list[int]:
+    """Channels in the recorded CTAPHID_INIT replies on the broadcast channel."""
+    channels = []
+    for event in events:
+        if event["event"] != "hid_in":
+            continue
+        channel, command, length = HID_INIT_HEADER.unpack_from(event["data"])
+        if channel == CTAPHID_BROADCAST_CHANNEL and command == 0x80 | CTAPHID_CMD.INIT and length >= 12:
+            channels.append(int.from_bytes(event["data"][HID_INIT_HEADER.size + 8: HID_INIT_HEADER.size + 12], "big"))
+    return channels
+
+
+def quantiles(samples: list[float]) -> str:
+    if not samples:
+        return "no samples"
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+    return f"n={len(ordered)} p50={at(0.5):.3f}ms p99={at(0.99):.3f}ms max={ordered[-1] * 1000:.3f}ms"
+
+
+class Replay:
+    def __init__(self, events: list[dict], fast: bool):
+        self.events = events
+        self.fast = fast
+        self.outputs: dict[str, list[tuple[bytes, float]]] = {event: [] for event in OUTPUT_EVENTS}
+        self.output_arrived = asyncio.Event()
+
+        device = next(event for event in events if event["event"] == "device")
+        max_msg_size = next((event["value"] for event in events if event["event"] == "max_msg_size"), 20)
+        device_properties = FakeProperties()
+        self.status_properties = FakeProperties()
+        self.ble_device = CTAPBLEDevice(FakeDeviceProxy(device_properties), FakeDevice1(device_properties),
+                                        device["device_path"], True, None, None, None)
+        self.hid_device = ReplayHIDDevice(self.ble_device, self, allocated_channels(events))
+        # the state a first connect leaves behind, later connects take the reconnect path
+        self.ble_device.max_msg_size = max_msg_size
+        self.ble_device.handler = partial(notify_message, self.hid_device.handle_ble_message)
+        self.ble_device.fido_control_point = FakeCharacteristic(self)
+        self.ble_device.fido_status = FakeCharacteristic(self)
+        self.ble_device.fido_status_notify_listen = self.status_properties
+
+    def produced(self, event: str, data):
+        self.outputs[event].append((bytes(data), time.perf_counter()))
+        self.output_arrived.set()
+
+    async def outputs_reach(self, expected: dict[str, int]) -> bool:
+        deadline = time.perf_counter() + OUTPUT_TIMEOUT
+        while any(len(self.outputs[event]) < count for event, count in expected.items()):
+            self.output_arrived.clear()
+            try:
+                await asyncio.wait_for(self.output_arrived.wait(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def feed(self, event: dict):
+        if event["event"] == "hid_out":
+            self.hid_device.device.receive_output(list(event["data"]), uhid._ReportType.UHID_OUTPUT_REPORT)
+        else:
+            self.status_properties.emit("org.bluez.GattCharacteristic1", {"Value": Variant("ay", event["data"])})
+
+    async def run(self) -> bool:
+        await self.hid_device.start()
+        expected = {event: 0 for event in OUTPUT_EVENTS}
+        overhead: dict[str, list[float]] = {}
+        recorded_overhead: dict[str, list[float]] = {}
+        # input event, when it was fed and when it was recorded
+        pending: Optional[tuple[str, float, float]] = None
+        # the last output recorded since that input, its index and when it was recorded
+        last_output: Optional[tuple[str, int, float]] = None
+        complete = True
+        replay_started = time.perf_counter()
+        recording_started = self.events[0]["t"]
+
+        def finish_step():
+            if pending is None or last_output is None:
+                return
+            label = f"{pending[0]}->{last_output[0]}"
+            outputs = self.outputs[last_output[0]]
+            if last_output[1] < len(outputs):
+                overhead.setdefault(label, []).append(outputs[last_output[1]][1] - pending[1])
+            recorded_overhead.setdefault(label, []).append(last_output[2] - pending[2])
+
+        for event in self.events:
+            kind = event["event"]
+            if kind == "max_msg_size":
+                self.ble_device.max_msg_size = event["value"]
+            elif kind in OUTPUT_EVENTS:
+                last_output = (kind, expected[kind], event["t"])
+                expected[kind] += 1
+            elif kind in INPUT_EVENTS:
+                if not await self.outputs_reach(expected):
+                    complete = False
+                    break
+                finish_step()
+                if not self.fast:
+                    delay = event["t"] - recording_started - (time.perf_counter() - replay_started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                pending = (kind, time.perf_counter(), event["t"])
+                last_output = None
+                self.feed(event)
+        else:
+            complete = await self.outputs_reach(expected)
+            finish_step()
+
+        # a response is accounted for a few loop iterations after its last report was written
+        drains = [task for task in (self.hid_device.hid_drain_task, self.hid_device.ble_drain_task) if task is not None]
+        if drains:
+            await asyncio.wait(drains, timeout=OUTPUT_TIMEOUT)
+        self.hid_device.active_tasks.cancel()
+        if self.hid_device.timeout_task:
+            self.hid_device.timeout_task.cancel()
+
+        identical = complete and self.compare()
+        for label in sorted(recorded_overhead):
+            print(f"{label:>22} replay: {quantiles(overhead.get(label, []))}")
+            print(f"{'':>22} recorded: {quantiles(recorded_overhead[label])}")
+        print("outputs identical" if identical else "outputs differ")
+        return identical
+
+    def compare(self) -> bool:
+        identical = True
+        for kind in OUTPUT_EVENTS:
+            recorded = [event["data"] for event in self.events if event["event"] == kind]
+            replayed = [data for data, _ in self.outputs[kind]]
+            for index, (want, got) in enumerate(zip(recorded, replayed)):
+                if want != got:
+                    print(f"{kind} #{index} differs:\n  recorded {want.hex()}\n  replayed {got.hex()}")
+                    identical = False
+            if len(recorded) != len(replayed):
+                print(f"{kind}: {len(recorded)} recorded, {len(replayed)} replayed")
+                identical = False
+        return identical
+
+
+async def replay(path: str, fast: bool) -> bool:
+    return await Replay(load_trace(path), fast).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="fido2ble.Replay", description="replay a recorded CTAP session against fake devices")
+    parser.add_argument('trace', help="trace written with --record-trace")
+    parser.add_argument('--fast', action='store_true', help="feed inputs as soon as the bridge is ready instead of at the recorded pace")
+    parser.add_argument('-l', '--log-level', default="warn", help="log level, either debug, info, warn or error")
+    args = parser.parse_args()
+    logging.basicConfig(level={"debug": logging.DEBUG, "info": logging.INFO, "error": logging.ERROR}.get(args.log_level, logging.WARNING))
+    sys.exit(0 if asyncio.run(replay(args.trace, args.fast)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Runtime tuning for the ``--runtime-profile latency`` option.
+
+The forwarding path allocates proxies, Variants and futures for every message,
+enough garbage for the cyclic collector to kick in while the user is tapping
+the authenticator. The latency profile moves those collections out of CTAP
+transactions: automatic collection is off while any transaction is active and
+the idle disconnect collects instead. Everything here is a no-op with the
+default profile.
+"""
+import asyncio
+import gc
+import logging
+import time
+from typing import Optional
+
+from .Latency import Histogram
+
+PROFILES = ("default", "latency")
+
+# gen0 threshold while the latency profile is active, the interpreter default is 700
+LATENCY_GC_THRESHOLD = 20000
+
+
+class GCMonitor:
+    """Records the pause of every collection through gc.callbacks."""
+
+    __slots__ = ("pauses", "longest", "during_transaction", "started", "collected")
+
+    def __init__(self):
+        self.pauses = Histogram()
+        self.longest = 0.0
+        self.during_transaction = 0
+        self.started = 0.0
+        self.collected = 0
+
+    def callback(self, phase: str, info: dict):
+        if phase == "start":
+            self.started = time.perf_counter()
+            return
+        pause = time.perf_counter() - self.started
+        self.pauses.record(pause)
+        self.longest = max(self.longest, pause)
+        self.collected += info.get("collected", 0)
+        if active_transactions:
+            self.during_transaction += 1
+            logging.info(f"GC generation {info.get('generation')} paused a transaction for {pause * 1000:.2f}ms")
+
+    def __str__(self):
+        # bucket bounds overestimate, the longest pause is exact
+        p50 = min(self.pauses.quantile(0.5), self.longest)
+        p99 = min(self.pauses.quantile(0.99), self.longest)
+        return (f"{self.pauses.count} GC pauses, {self.during_transaction} during transactions, "
+                f"p50 {p50 * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms, "
+                f"max {self.longest * 1000:.2f}ms, {self.collected} objects collected")
+
+
+monitor: Optional[GCMonitor] = None
+active_transactions = 0
+
+
+def install(profile: str):
+    """Apply ``profile`` before the event loop is created."""
+    global monitor
+    if profile != "latency":
+        return
+    try:
+        import uvloop
+    except ImportError:
+        logging.info("uvloop is not installed, using the default event loop")
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logging.info("Using the uvloop event loop")
+    _, threshold1, threshold2 = gc.get_threshold()
+    gc.set_threshold(LATENCY_GC_THRESHOLD, threshold1, threshold2)
+    monitor = GCMonitor()
+    gc.callbacks.append(monitor.callback)
+
+
+def freeze():
+    """Move everything alive after device bring-up out of the collector's reach."""
+    if monitor is None:
+        return
+    gc.collect()
+    gc.freeze()
+    logging.info(f"Froze {gc.get_freeze_count()} objects after startup")
+
+
+def transaction_started():
+    global active_transactions
+    if monitor is None:
+        return
+    active_transactions += 1
+    gc.disable()
+
+
+def transaction_finished():
+    global active_transactions
+    if monitor is None:
+        return
+    active_transactions -= 1
+    if not active_transactions:
+        gc.enable()
+
+
+def idle():
+    """Collect while no transaction runs, called when a device is disconnected for being idle."""
+    if monitor is None or active_transactions:
+        return
+    gc.collect()
+    logging.info(str(monitor))
@@ -0,0 +1,35 @@
+class DeviceStatistics:
+    """Counters for one bridged authenticator.
+
+    Plain integer attributes, incremented in place on the forwarding path and
+    read by the control service. Directions are named after the side the data
+    leaves on: ``hid_*_sent`` goes to the client, ``ble_*_sent`` goes to the
+    authenticator.
+    """
+
+    __slots__ = (
+        "hid_frames_received",
+        "hid_messages_received",
+        "hid_bytes_received",
+        "hid_frames_sent",
+        "hid_messages_sent",
+        "hid_bytes_sent",
+        "ble_fragments_received",
+        "ble_messages_received",
+        "ble_bytes_received",
+        "ble_fragments_sent",
+        "ble_messages_sent",
+        "ble_bytes_sent",
+        "reconnects",
+        "timeouts",
+    )
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        for counter in self.__slots__:
+            setattr(self, counter, 0)
+
+    def as_dict(self) -> dict[str, int]:
+        return {counter: getattr(self, counter) for counter in self.__slots__}
@@ -0,0 +1,55 @@
+"""Minimal sd_notify(3) client speaking the NOTIFY_SOCKET datagram protocol.
+
+Everything is a no-op when the daemon is not started by systemd with
+Type=notify, so it can be called unconditionally.
+"""
+import asyncio
+import logging
+import os
+import socket
+from typing import Optional
+
+
+def notify(*fields: str) -> bool:
+    """Send ``fields`` such as "READY=1" to systemd, returns False if there is nobody to tell."""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address[0] == "@":
+        # abstract namespace socket
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.connect(address)
+            sock.sendall("\n".join(fields).encode())
+    except OSError as error:
+        logging.warning(f"Unable to notify systemd, error: {error}")
+        return False
+    return True
+
+
+def watchdog_interval() -> Optional[float]:
+    """Seconds within which systemd expects WATCHDOG=1, None if the watchdog is off."""
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not usec or (pid and int(pid) != os.getpid()):
+        return None
+    return int(usec) / 1_000_000
+
+
+async def watchdog(interval: float):
+    """Ping the watchdog from the event loop, so a stalled loop stops the pings.
+
+    Pings go out at half the interval. A ping that is late by more than a
+    quarter of the interval means the loop was blocked, which is logged before
+    systemd has to step in.
+    """
+    loop = asyncio.get_running_loop()
+    period = interval / 2
+    while True:
+        expected = loop.time() + period
+        await asyncio.sleep(period)
+        lag = loop.time() - expected
+        if lag > interval / 4:
+            logging.warning(f"Event loop was blocked for {lag * 1000:.0f}ms")
+        notify("WATCHDOG=1")
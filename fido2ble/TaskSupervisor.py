@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Callable, Coroutine, Optional
+
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+class TaskSupervisor:
+    """Keeps track of the tasks spawned on behalf of one device.
+
+    Finished tasks remove themselves through a done callback, so the set only
+    ever holds work that is still pending. At most ``max_in_flight`` tasks run
+    their coroutine at the same time, the rest wait for a free slot.
+    """
+
+    __slots__ = ("name", "max_in_flight", "spawned", "finished", "cancelled", "_tasks", "_slots")
+
+    def __init__(self, name: str, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.spawned = 0
+        self.finished = 0
+        self.cancelled = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __iter__(self):
+        return iter(tuple(self._tasks))
+
+    async def _run(self, coro: Coroutine, bounded: bool):
+        if not bounded:
+            return await coro
+        if self._slots is None:
+            # created lazily so it binds to the running loop
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        try:
+            async with self._slots:
+                return await coro
+        finally:
+            # closes the coroutine if we were cancelled while waiting for a slot
+            coro.close()
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            self.cancelled += 1
+            return
+        self.finished += 1
+        error = task.exception()
+        if error is not None:
+            logging.warning(f"Task {task.get_name()} of {self.name} failed, error: {error}")
+
+    def spawn(self, coro: Coroutine, name: Optional[str] = None, bounded: bool = True) -> asyncio.Task:
+        """Run ``coro`` as a supervised task, unbounded tasks skip the concurrency cap."""
+        task = asyncio.create_task(self._run(coro, bounded), name=name)
+        self._tasks.add(task)
+        self.spawned += 1
+        task.add_done_callback(self._task_done)
+        return task
+
+    def cancel(self, keep: Optional[Callable[[asyncio.Task], bool]] = None) -> None:
+        """Cancel all pending tasks except the calling one and those matched by ``keep``."""
+        current = asyncio.current_task()
+        for task in tuple(self._tasks):
+            if task is current or (keep is not None and keep(task)):
+                continue
+            task.cancel()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": len(self._tasks),
+            "spawned": self.spawned,
+            "finished": self.finished,
+            "cancelled": self.cancelled,
+        }
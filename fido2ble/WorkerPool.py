@@ -0,0 +1,238 @@
+"""Sharding of the bridged authenticators across worker processes.
+
+With ``--workers N`` the main process only watches BlueZ. Every paired FIDO
+device is assigned to the worker bridging the fewest devices, and stays there
+for as long as that worker runs. A worker is the regular daemon started with
+``--worker``, with its own bus connections, CTAPBLEDevice and CTAPHIDDevice
+per assigned device. It reads commands from stdin and reports on stdout, both
+as one JSON object per line::
+
+    {"add": ["/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF"]}    parent -> worker
+    {"remove": "/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF"}   parent -> worker
+    {"added": ["/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF"]}  worker -> parent, once their hidraw nodes exist
+    {"load": {"devices": 1, "cpu": 0.02, "messages": 7}}   worker -> parent
+
+A worker that exits is started again with the same devices, the others keep
+running. A worker exits when its stdin is closed, so workers never outlive
+the parent.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Optional
+
+from . import SystemdNotify
+
+LOAD_REPORT_INTERVAL = 10  # seconds between load reports of a worker
+READY_TIMEOUT = 30  # seconds the parent waits for the workers to bring up their devices before READY=1
+RESTART_BACKOFF_INITIAL = 1
+RESTART_BACKOFF_MAX = 60
+STABLE_AFTER = 60  # seconds a worker has to run before its restart backoff is reset
+
+# a worker must not talk to systemd, the parent reports readiness and pings the watchdog
+WORKER_ENVIRONMENT_EXCLUDED = ("NOTIFY_SOCKET", "WATCHDOG_USEC", "WATCHDOG_PID")
+
+
+class Worker:
+    __slots__ = ("index", "argv", "paths", "process", "load", "restarts", "pending_adds", "added", "_task")
+
+    def __init__(self, index: int, argv: list[str]):
+        self.index = index
+        self.argv = argv
+        self.paths: set[str] = set()
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.load: dict = {}
+        self.restarts = 0
+        self.pending_adds = 0  # add commands not answered with added yet
+        self.added = asyncio.Event()  # set while no add command is pending, first set once the process runs
+        self._task: Optional[asyncio.Task] = None
+
+    def send(self, command: dict):
+        if self.process is None or self.process.stdin is None or self.process.stdin.is_closing():
+            # picked up from self.paths when the worker is started again
+            return
+        self.process.stdin.write(json.dumps(command).encode() + b"\n")
+        if "add" in command:
+            self.pending_adds += 1
+            self.added.clear()
+
+    async def _spawn(self):
+        environment = {key: value for key, value in os.environ.items() if key not in WORKER_ENVIRONMENT_EXCLUDED}
+        self.process = await asyncio.create_subprocess_exec(
+            *self.argv, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, env=environment)
+        self.load = {}
+        # the add commands sent to the previous process are resent below
+        self.pending_adds = 0
+        logging.info(f"Started worker {self.index} as pid {self.process.pid}")
+        if self.paths:
+            self.send({"add": sorted(self.paths)})
+        else:
+            self.added.set()
+
+    async def _read_reports(self):
+        async for line in self.process.stdout:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                # anything else printed by the worker, not a report
+                logging.info(f"Worker {self.index}: {line.decode(errors='replace').rstrip()}")
+                continue
+            if "load" in report:
+                self.load = report["load"]
+            if "added" in report and self.pending_adds:
+                self.pending_adds -= 1
+                if not self.pending_adds:
+                    self.added.set()
+
+    async def run(self):
+        backoff = RESTART_BACKOFF_INITIAL
+        while True:
+            started = time.monotonic()
+            try:
+                await self._spawn()
+            except OSError as error:
+                self.process = None
+                returncode = error
+            else:
+                await self._read_reports()
+                returncode = await self.process.wait()
+            self.restarts += 1
+            if time.monotonic() - started > STABLE_AFTER:
+                backoff = RESTART_BACKOFF_INITIAL
+            logging.warning(f"Worker {self.index} exited with {returncode}, restarting it in {backoff}s "
+                            f"with its {len(self.paths)} devices")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run(), name=f"worker-{self.index}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.process is not None and self.process.returncode is None:
+            self.process.stdin.close()
+            await self.process.wait()
+
+    def __str__(self):
+        load = self.load
+        return (f"worker {self.index}: {len(self.paths)} devices, {load.get('cpu', 0) * 100:.0f}% CPU, "
+                f"{load.get('messages', 0)} messages, {self.restarts} restarts")
+
+
+class WorkerPool:
+    """Assigns device paths to ``count`` workers started with ``argv``."""
+
+    def __init__(self, count: int, argv: list[str]):
+        self.workers = [Worker(index, argv) for index in range(count)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    async def stop(self):
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+    @property
+    def paths(self) -> set[str]:
+        return {path for worker in self.workers for path in worker.paths}
+
+    def add(self, paths: list[str]):
+        """Assign the paths not assigned yet, each to the worker with the fewest devices."""
+        batches: dict[int, list[str]] = {}
+        for path in paths:
+            if any(path in worker.paths for worker in self.workers):
+                continue
+            worker = min(self.workers, key=lambda candidate: len(candidate.paths))
+            worker.paths.add(path)
+            batches.setdefault(worker.index, []).append(path)
+            logging.info(f"Assigned {path} to worker {worker.index}")
+        for index, batch in batches.items():
+            self.workers[index].send({"add": batch})
+
+    def remove(self, path: str) -> bool:
+        for worker in self.workers:
+            if path in worker.paths:
+                worker.paths.discard(path)
+                worker.send({"remove": path})
+                return True
+        return False
+
+    async def wait_added(self, timeout: float = READY_TIMEOUT) -> bool:
+        """Wait until every worker has brought up the devices assigned to it, False on timeout."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(worker.added.wait() for worker in self.workers)), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def status(self) -> str:
+        """One line for systemd: devices and CPU share of every worker."""
+        loads = ", ".join(f"{len(worker.paths)}/{worker.load.get('cpu', 0) * 100:.0f}%" for worker in self.workers)
+        return f"Bridging {len(self.paths)} FIDO devices in {len(self.workers)} workers (devices/CPU: {loads})"
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(LOAD_REPORT_INTERVAL)
+            SystemdNotify.notify(f"STATUS={self.status()}")
+            logging.debug(str(self))
+
+    def __str__(self):
+        return "\n".join(str(worker) for worker in self.workers)
+
+
+def worker_argv(argv: list[str]) -> list[str]:
+    """The command line of a worker, the parent's own options without --workers."""
+    result = [sys.executable, "-m", "fido2ble.fido2ble", "--worker"]
+    skip = False
+    for argument in argv:
+        if skip:
+            skip = False
+            continue
+        if argument in ("-w", "--workers"):
+            skip = True
+            continue
+        if argument.startswith(("--workers=", "-w")) or argument == "--exit-when-idle":
+            continue
+        result.append(argument)
+    return result
+
+
+async def worker_commands(add, remove):
+    """Run the commands the parent sends on stdin until it closes it.
+
+    ``add`` is awaited with a list of device paths, ``remove`` called with one.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    async for line in reader:
+        if not line.strip():
+            continue
+        command = json.loads(line)
+        if "add" in command:
+            await add(command["add"])
+        if "remove" in command:
+            remove(command["remove"])
+
+
+def report_added(paths: list[str]):
+    """Tell the parent that the hidraw nodes of an add command exist."""
+    sys.stdout.write(json.dumps({"added": paths}) + "\n")
+    sys.stdout.flush()
+
+
+async def report_load(load):
+    """Write ``load()`` merged with the CPU share since the previous report to stdout, every LOAD_REPORT_INTERVAL."""
+    cpu = time.process_time()
+    wall = time.monotonic()
+    while True:
+        await asyncio.sleep(LOAD_REPORT_INTERVAL)
+        now_cpu, now_wall = time.process_time(), time.monotonic()
+        report = dict(load(), cpu=round((now_cpu - cpu) / (now_wall - wall), 4))
+        cpu, wall = now_cpu, now_wall
+        sys.stdout.write(json.dumps({"load": report}) + "\n")
+        sys.stdout.flush()
@@ -1,26 +1,49 @@
 #!/usr/bin/env python
+import time
+
+STARTED_AT = time.monotonic()  # before the imports below, they are part of the startup time
 
 import argparse
 import asyncio
 import logging
+import sys
+from functools import partial
+from typing import Optional
 
-from .vendored.dbus_fast import BusType
+from .vendored import uhid
+from .vendored.dbus_fast import BusType, NameFlag, RequestNameReply
 from .vendored.dbus_fast.aio import MessageBus
 
-from .CTAPBLEDevice import CTAPBLEDevice, find_characteristics
+from .CTAPBLEDevice import (CTAPBLEDevice, find_characteristics, FIDO_CONTROL_POINT_UUID, FIDO_STATUS_UUID,
+                            FIDO_CONTROL_POINT_LENGTH_UUID, FIDO_SERVICE_REVISION_BITFIELD_UUID)
 from .CTAPHIDDevice import CTAPHIDDevice
+from .Diagnostics import DEFAULT_DIAGNOSTICS_DIR, Diagnostics
+from .GattCache import DEFAULT_CACHE_DIR, GattCache
+from .WorkerPool import READY_TIMEOUT, WorkerPool, report_added, report_load, worker_argv, worker_commands
+from . import RuntimeProfile, SystemdNotify
 
 FIDO_SERVICE_UUID = "0000fffd-0000-1000-8000-00805f9b34fb"
-FIDO_CONTROL_POINT_UUID = "f1d0fff1-deaa-ecee-b42f-c9ba7ed623bb"
-FIDO_STATUS_UUID = "f1d0fff2-deaa-ecee-b42f-c9ba7ed623bb"
-FIDO_CONTROL_POINT_LENGTH_UUID = "f1d0fff3-deaa-ecee-b42f-c9ba7ed623bb"
-FIDO_SERVICE_REVISION_BITFIELD_UUID = "f1d0fff4-deaa-ecee-b42f-c9ba7ed623bb"
+
+STARTUP_CONCURRENCY = 8  # devices brought up at the same time
+IDLE_EXIT_GRACE = 60  # seconds without a paired FIDO device before --exit-when-idle exits, pairing takes a while
 
 DEVICE_INTERFACE = "org.bluez.Device1"
+GATT_CHARACTERISTIC_INTERFACE = "org.bluez.GattCharacteristic1"
 PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
 
 fido_devices: dict[str, CTAPBLEDevice]
 hid_devices:  dict[str, CTAPHIDDevice]
+gatt_cache = GattCache()
+control_bus: Optional[MessageBus] = None
+exit_when_idle = False
+idle_exit_task: Optional[asyncio.Task] = None
+diagnostics_dir = DEFAULT_DIAGNOSTICS_DIR
+trace_dir: Optional[str] = None
+use_uhid_thread = False
+uhid_thread: Optional[uhid.UHIDThread] = None
+worker_pool: Optional[WorkerPool] = None  # set in the parent with --workers
+assigned_paths: Optional[set[str]] = None  # set in a worker, the devices the parent assigned to it
+shutdown: asyncio.Event
 
 async def properties_changed(interface, changed, invalidated):
     """Handles property changes for Bluetooth devices."""
@@ -36,20 +59,72 @@ async def interfaces_added(path, interfaces, bus):
             for uuid in device1_interface['UUIDs'].value:
                 if uuid == FIDO_SERVICE_UUID:
                     logging.info(f"Found new FIDO device: {path}")
-                    # Get the specific device object
-                    obj = bus.get_proxy_object('org.bluez', path, await bus.introspect('org.bluez', path))
-                    props = obj.get_interface(PROPERTIES_INTERFACE)
-                    props.on_properties_changed(properties_changed)
+                    await watch_device(path, bus)
+
+async def watch_device(path, bus):
+    """Bridge the device at ``path`` once it is paired."""
+    # Get the specific device object
+    obj = bus.get_proxy_object('org.bluez', path, await bus.introspect('org.bluez', path))
+    props = obj.get_interface(PROPERTIES_INTERFACE)
+    props.on_properties_changed(properties_changed)
 
 async def interfaces_removed(path, interfaces):
     """Handles removed interfaces (e.g., Bluetooth device lost/disconnected)."""
     if DEVICE_INTERFACE in interfaces:
-        if path in fido_devices:
-            fido_devices[path].remove_signal_handler()
-            del fido_devices[path]
-            hid_devices[path].device.destroy()
-            del hid_devices[path]
-            logging.info(f"Device Removed: {path}")
+        if worker_pool is not None:
+            if worker_pool.remove(path):
+                logging.info(f"Device Removed: {path}")
+                devices_changed()
+            return
+        remove_device(path)
+
+
+def remove_device(path):
+    if assigned_paths is not None:
+        assigned_paths.discard(path)
+    if path in fido_devices:
+        fido_devices[path].remove_signal_handler()
+        del fido_devices[path]
+        hid_devices[path].device.destroy()
+        del hid_devices[path]
+        unexport_device(path)
+        logging.info(f"Device Removed: {path}")
+        devices_changed()
+
+
+def bridging_status() -> str:
+    if worker_pool is not None:
+        return worker_pool.status()
+    return f"Bridging {len(hid_devices)} FIDO devices"
+
+
+def devices_changed():
+    SystemdNotify.notify(f"STATUS={bridging_status()}")
+    bridged = worker_pool.paths if worker_pool is not None else hid_devices
+    if exit_when_idle:
+        schedule_idle_exit(not bridged)
+
+
+def schedule_idle_exit(idle: bool):
+    """Exit after IDLE_EXIT_GRACE unless a device is bridged by then.
+
+    The udev rule starts the service when the link comes up, which is before
+    BlueZ marks a device that is being paired as paired.
+    """
+    global idle_exit_task
+    if not idle:
+        if idle_exit_task is not None:
+            idle_exit_task.cancel()
+            idle_exit_task = None
+        return
+    if idle_exit_task is None or idle_exit_task.done():
+        idle_exit_task = asyncio.create_task(exit_after_grace())
+
+
+async def exit_after_grace():
+    await asyncio.sleep(IDLE_EXIT_GRACE)
+    logging.info(f"No FIDO devices paired for {IDLE_EXIT_GRACE}s, exiting")
+    shutdown.set()
 
 
 async def monitor_bluez():
@@ -70,7 +145,30 @@ async def monitor_bluez():
     # noinspection PyUnresolvedReferences
     manager.on_interfaces_removed(interfaces_removed)
 
+    # devices that are known but not paired yet never show up in InterfacesAdded again
+    dbus_managed_objects = await bus.get_managed_objects(
+        'org.bluez', path_prefix='/org/bluez/', interfaces=(DEVICE_INTERFACE,))
+    for path, interfaces in dbus_managed_objects.items():
+        device1_properties = interfaces.get(DEVICE_INTERFACE)
+        if device1_properties is None or is_paired(device1_properties):
+            continue
+        if 'UUIDs' in device1_properties and FIDO_SERVICE_UUID in device1_properties['UUIDs'].value:
+            await watch_device(path, bus)
+
 async def create_device(device_path, dbus_managed_objects, bus) -> CTAPBLEDevice:
+    snapshot = gatt_cache.load(device_path)
+    if snapshot is not None:
+        # a snapshot from a previous run skips introspection and characteristic discovery
+        characteristic_paths = snapshot["characteristics"]
+        device_proxy = bus.get_proxy_object('org.bluez', device_path, snapshot["introspection"][device_path])
+        device1 = device_proxy.get_interface('org.bluez.Device1')
+        return CTAPBLEDevice(device_proxy, device1, device_path, True,
+                             characteristic_paths[FIDO_CONTROL_POINT_UUID],
+                             characteristic_paths[FIDO_CONTROL_POINT_LENGTH_UUID],
+                             characteristic_paths[FIDO_STATUS_UUID],
+                             characteristic_paths[FIDO_SERVICE_REVISION_BITFIELD_UUID],
+                             gatt_cache=gatt_cache, snapshot=snapshot)
+
     device_proxy = bus.get_proxy_object('org.bluez', device_path, await bus.introspect('org.bluez', device_path))
     device1 = device_proxy.get_interface('org.bluez.Device1')
     cached = False
@@ -84,64 +182,219 @@ async def create_device(device_path, dbus_managed_objects, bus) -> CTAPBLEDevice
         FIDO_CONTROL_POINT_UUID: None,
         FIDO_CONTROL_POINT_LENGTH_UUID: None,
         FIDO_STATUS_UUID: None,
+        FIDO_SERVICE_REVISION_BITFIELD_UUID: None,
     }
 
     await find_characteristics(device_path, dbus_managed_objects, characteristic_paths)
     control_point_path = characteristic_paths[FIDO_CONTROL_POINT_UUID]
     control_point_length_path = characteristic_paths[FIDO_CONTROL_POINT_LENGTH_UUID]
     status_path = characteristic_paths[FIDO_STATUS_UUID]
-    return CTAPBLEDevice(device_proxy, device1, device_path, cached, control_point_path, control_point_length_path, status_path)
+    service_revision_path = characteristic_paths[FIDO_SERVICE_REVISION_BITFIELD_UUID]
+    return CTAPBLEDevice(device_proxy, device1, device_path, cached, control_point_path, control_point_length_path, status_path,
+                         service_revision_path, gatt_cache=gatt_cache)
+
+
+def is_paired(device1_properties) -> bool:
+    # entries without the property are possible, treat them as not paired
+    paired = device1_properties.get('Paired')
+    return paired is not None and bool(paired.value)
+
+
+def is_fido_device(device1_properties) -> bool:
+    if not is_paired(device1_properties):
+        return False
+    if 'UUIDs' in device1_properties:
+        return FIDO_SERVICE_UUID in device1_properties['UUIDs'].value
+    if 'ServiceData' in device1_properties:
+        return FIDO_SERVICE_UUID in device1_properties['ServiceData'].value.keys()
+    return False
 
 
 async def find_fido() -> dict[str, CTAPBLEDevice]:
     bus: MessageBus = await MessageBus(bus_type=BusType.SYSTEM).connect()
-    bluez_introspect = await bus.introspect(
-        "org.bluez", '/'
-    )
-
-    dbus_proxy = bus.get_proxy_object('org.bluez', '/', bluez_introspect)
-    # noinspection PyUnresolvedReferences
-    dbus_managed_objects = await dbus_proxy.get_interface("org.freedesktop.DBus.ObjectManager").call_get_managed_objects()
+    # adapters, services, descriptors and every other interface are skipped undecoded
+    dbus_managed_objects = await bus.get_managed_objects(
+        'org.bluez', path_prefix='/org/bluez/', interfaces=(DEVICE_INTERFACE, GATT_CHARACTERISTIC_INTERFACE))
     global fido_devices
 
-    for device_path in dbus_managed_objects:
-        if device_path in fido_devices:
+    new_device_paths = [
+        device_path for device_path, interfaces in dbus_managed_objects.items()
+        if device_path not in fido_devices and 'org.bluez.Device1' in interfaces and is_fido_device(interfaces['org.bluez.Device1'])
+        and (assigned_paths is None or device_path in assigned_paths)
+    ]
+    # bring devices up concurrently, bounded so a crowded adapter does not flood bluetoothd
+    slots = asyncio.Semaphore(STARTUP_CONCURRENCY)
+
+    async def create(device_path):
+        async with slots:
+            logging.info(f"Added {device_path} as FIDO device")
+            return await create_device(device_path, dbus_managed_objects, bus)
+
+    devices = await asyncio.gather(*(create(device_path) for device_path in new_device_paths), return_exceptions=True)
+    for device_path, device in zip(new_device_paths, devices):
+        if isinstance(device, BaseException):
+            logging.warning(f"Unable to add {device_path}, error: {device}")
             continue
-        if 'org.bluez.Device1' in dbus_managed_objects[device_path]:
-            if dbus_managed_objects[device_path]['org.bluez.Device1']['Paired'].value:
-                if 'UUIDs' in dbus_managed_objects[device_path]['org.bluez.Device1']:
-                    for uuid in dbus_managed_objects[device_path]['org.bluez.Device1']['UUIDs'].value:
-                        if uuid == FIDO_SERVICE_UUID:
-                            logging.info(f"Added {device_path} as FIDO device")
-                            fido_devices[device_path] = await create_device(device_path, dbus_managed_objects, bus)
-                elif 'ServiceData' in dbus_managed_objects[device_path]['org.bluez.Device1']:
-                    if FIDO_SERVICE_UUID in dbus_managed_objects[device_path]['org.bluez.Device1']['ServiceData'].value.keys():
-                        logging.info(f"Added {device_path} as FIDO device")
-                        fido_devices[device_path] = await create_device(device_path, dbus_managed_objects, bus)
+        fido_devices[device_path] = device
     return fido_devices
 
 
-async def update_fido_devices():
+async def update_fido_devices() -> list[asyncio.Task]:
+    """Bridge newly paired devices, returns the tasks waiting for their hidraw nodes."""
     global fido_devices, hid_devices
+    if worker_pool is not None:
+        worker_pool.add(await find_fido_paths())
+        devices_changed()
+        return []
     fido_devices = await find_fido()
+    starting = []
     for fido_device in fido_devices:
         if fido_device not in hid_devices:
-            hid = CTAPHIDDevice(fido_devices[fido_device])
-            asyncio.create_task(hid.start())
+            hid = CTAPHIDDevice(fido_devices[fido_device], uhid_backend())
+            if trace_dir:
+                from .Replay import record
+                record(hid, trace_dir)
+            starting.append(asyncio.create_task(hid.start()))
             hid_devices[fido_device] = hid
+            export_device(fido_device, hid)
+    devices_changed()
+    return starting
+
+
+async def find_fido_paths() -> list[str]:
+    """Paths of the paired FIDO devices, without bringing them up."""
+    bus: MessageBus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+    try:
+        dbus_managed_objects = await bus.get_managed_objects(
+            'org.bluez', path_prefix='/org/bluez/', interfaces=(DEVICE_INTERFACE,))
+    finally:
+        bus.disconnect()
+    return [
+        device_path for device_path, interfaces in dbus_managed_objects.items()
+        if DEVICE_INTERFACE in interfaces and is_fido_device(interfaces[DEVICE_INTERFACE])
+    ]
+
+
+def uhid_backend():
+    """All /dev/uhid fds are serviced by one thread with --uhid-thread, by the event loop otherwise."""
+    global uhid_thread
+    if not use_uhid_thread:
+        return uhid.AsyncioBlockingUHID
+    if uhid_thread is None:
+        uhid_thread = uhid.UHIDThread(asyncio.get_running_loop())
+    return partial(uhid.ThreadedBlockingUHID, uhid_thread)
+
+
+async def report_ready(starting: list[asyncio.Task]):
+    if not starting:
+        logging.info(f"Ready after {(time.monotonic() - STARTED_AT) * 1000:.0f}ms, no FIDO devices paired")
+        return
+    for count, started in enumerate(asyncio.as_completed(starting), 1):
+        await started
+        if count == 1:
+            logging.info(f"First hidraw available after {(time.monotonic() - STARTED_AT) * 1000:.0f}ms")
+    logging.info(f"All {len(starting)} hidraw available after {(time.monotonic() - STARTED_AT) * 1000:.0f}ms")
+
+
+async def report_pool_ready():
+    if not await worker_pool.wait_added():
+        logging.warning(f"Workers did not bring up their devices within {READY_TIMEOUT}s, reporting ready anyway")
+        return
+    logging.info(f"Ready after {(time.monotonic() - STARTED_AT) * 1000:.0f}ms, "
+                 f"{len(worker_pool.paths)} FIDO devices in {len(worker_pool.workers)} workers")
+
+
+def export_device(device_path, hid):
+    if control_bus is not None:
+        from .ControlService import DeviceControlInterface, device_object_path
+        control_bus.export(device_object_path(device_path), DeviceControlInterface(hid))
+
+
+def unexport_device(device_path):
+    if control_bus is not None:
+        from .ControlService import device_object_path
+        control_bus.unexport(device_object_path(device_path))
+
+
+async def start_control_service():
+    """Export statistics and control of every device under CONTROL_BUS_NAME, if the bus policy allows it."""
+    global control_bus
+    from .ControlService import CONTROL_BUS_NAME
+    try:
+        bus: MessageBus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+        reply = await bus.request_name(CONTROL_BUS_NAME, NameFlag.DO_NOT_QUEUE)
+    except Exception as error:
+        logging.warning(f"Unable to provide {CONTROL_BUS_NAME}, error: {error}")
+        return
+    if reply != RequestNameReply.PRIMARY_OWNER:
+        logging.warning(f"Unable to provide {CONTROL_BUS_NAME}, reply: {reply.name}")
+        bus.disconnect()
+        return
+    control_bus = bus
 
 async def start_system():
-    global fido_devices, hid_devices
+    global fido_devices, hid_devices, shutdown
     fido_devices = {}
     hid_devices = {}
-    await update_fido_devices()
+    shutdown = asyncio.Event()
+    Diagnostics(diagnostics_dir, lambda: hid_devices).install(asyncio.get_running_loop())
+    if worker_pool is not None:
+        # the devices live in the workers, none of them owns the control service
+        worker_pool.start()
+        asyncio.create_task(worker_pool.report())
+    else:
+        await start_control_service()
+    starting = await update_fido_devices()
     await monitor_bluez()
-    await asyncio.Event().wait()
+    if worker_pool is not None:
+        await report_pool_ready()
+    else:
+        await report_ready(starting)
+    RuntimeProfile.freeze()
+    SystemdNotify.notify("READY=1", f"STATUS={bridging_status()}")
+    watchdog_interval = SystemdNotify.watchdog_interval()
+    if watchdog_interval:
+        asyncio.create_task(SystemdNotify.watchdog(watchdog_interval))
+    await shutdown.wait()
+    SystemdNotify.notify("STOPPING=1")
+    if worker_pool is not None:
+        await worker_pool.stop()
+
+
+async def run_worker():
+    """Bridge the devices the parent of a --workers pool assigns, until it closes stdin."""
+    global fido_devices, hid_devices, assigned_paths, shutdown
+    fido_devices = {}
+    hid_devices = {}
+    assigned_paths = set()
+    shutdown = asyncio.Event()
+    Diagnostics(diagnostics_dir, lambda: hid_devices).install(asyncio.get_running_loop())
+
+    async def add(paths):
+        assigned_paths.update(paths)
+        starting = await update_fido_devices()
+        # devices that failed to come up are not waited for, they are logged by find_fido
+        await asyncio.gather(*starting)
+        report_added(paths)
+
+    asyncio.create_task(report_load(lambda: {
+        "devices": len(hid_devices),
+        "messages": sum(hid.stats.hid_messages_received for hid in hid_devices.values()),
+    }))
+    await worker_commands(add, remove_device)
 
 def main():
     parser = argparse.ArgumentParser(prog="fido2ble", description="connect with BLE FIDO2 devices")
     parser.add_argument('-l', '--log-level', default="warn", help="log level of service, either debug, info, warn or error")
     parser.add_argument('-u', '--uhid-log-level', default="error", help="log level of uhid device, either debug, info, warn or error")
+    parser.add_argument('-c', '--cache-dir', default=DEFAULT_CACHE_DIR, help="directory for the per-device GATT layout cache, empty to disable")
+    parser.add_argument('-p', '--runtime-profile', default="default", choices=RuntimeProfile.PROFILES, help="latency uses uvloop if installed and keeps garbage collection out of CTAP transactions, at the cost of memory")
+    parser.add_argument('-d', '--diagnostics-dir', default=DEFAULT_DIAGNOSTICS_DIR, help="directory the profile started and stopped with SIGUSR1 is written to")
+    parser.add_argument('--record-trace', metavar="DIR", help="record the CTAP traffic of every device to DIR, for replay with python -m fido2ble.Replay")
+    parser.add_argument('--uhid-thread', action='store_true', help="service /dev/uhid from a dedicated thread, so HID reports are not held up by bursts of D-Bus traffic")
+    parser.add_argument('-w', '--workers', type=int, default=0, help="bridge the devices in this many worker processes, restarted individually when they crash")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--exit-when-idle', action='store_true', help="exit while no FIDO devices are paired, the udev rule starts the service again on the next Bluetooth connection")
 
     args = parser.parse_args()
 
@@ -175,6 +428,18 @@ def main():
         format="%(asctime)s.%(msecs)03d %(message)s",
         datefmt='%I:%M:%S')
     logging.getLogger("UHIDDevice").setLevel(uhid_loglevel)
+    global gatt_cache, exit_when_idle, diagnostics_dir, trace_dir, use_uhid_thread, worker_pool
+    gatt_cache = GattCache(args.cache_dir or None)
+    exit_when_idle = args.exit_when_idle
+    diagnostics_dir = args.diagnostics_dir
+    trace_dir = args.record_trace
+    use_uhid_thread = args.uhid_thread
+    RuntimeProfile.install(args.runtime_profile)
+    if args.worker:
+        asyncio.run(run_worker())
+        return
+    if args.workers > 0:
+        worker_pool = WorkerPool(args.workers, worker_argv(sys.argv[1:]))
     asyncio.run(start_system())
 
 if __name__ == "__main__":
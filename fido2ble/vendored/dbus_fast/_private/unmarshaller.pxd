@@ -95,6 +95,25 @@ cdef unsigned int TOKEN_LEFT_PAREN_AS_INT
 cdef object MARSHALL_STREAM_END_ERROR
 cdef object DEFAULT_BUFFER_SIZE
 
+cdef unsigned int STRING_CACHE_MAX_LENGTH
+
+
+cdef class StringCache:
+
+    cdef public dict strings
+    cdef public dict pinned
+    cdef public unsigned int max_size
+    cdef public unsigned long long hits
+    cdef public unsigned long long misses
+    cdef public unsigned long long resets
+
+    @cython.locals(cached=cython.str)
+    cpdef str get(self, str string)
+
+    @cython.locals(pinned=cython.str)
+    cpdef str pin(self, str string)
+
+
 cdef cython.uint EAGAIN
 cdef cython.uint EWOULDBLOCK
 
@@ -139,20 +158,30 @@ cdef class Unmarshaller:
     cdef bint _negotiate_unix_fd
     cdef bint _read_complete
     cdef unsigned int _endian
+    cdef object _body_filters
+    cdef unsigned int _buf_end
 
+    @cython.locals(
+        to_clear=cython.uint,
+        remaining=cython.uint,
+    )
     cdef _next_message(self)
 
     cdef bint _has_another_message_in_buffer(self)
 
+    @cython.locals(missing=cython.long)
+    cdef void _reserve(self, unsigned int size)
+
     @cython.locals(
-        msg=cython.bytes,
+        read=cython.uint,
         recv=cython.tuple,
         errno=cython.uint
     )
     cdef void _read_sock_with_fds(self, unsigned int pos, unsigned int missing_bytes)
 
     @cython.locals(
-        data=cython.bytes,
+        read=cython.uint,
+        size=cython.uint,
         errno=cython.uint
     )
     cdef void _read_sock_without_fds(self, unsigned int pos)
@@ -187,6 +216,12 @@ cdef class Unmarshaller:
     )
     cdef str _read_string_unpack(self)
 
+    @cython.locals(
+        str_start=cython.uint,
+        str_length=cython.uint,
+    )
+    cdef str _read_string_interned(self)
+
     @cython.locals(
         tree=SignatureTree,
         token_as_int=cython.uint,
@@ -222,6 +257,7 @@ cdef class Unmarshaller:
 
     @cython.locals(
         body=cython.list,
+        body_filter=cython.tuple,
         header_fields=cython.dict,
         token_as_int=cython.uint,
         signature=cython.str,
@@ -232,6 +268,19 @@ cdef class Unmarshaller:
 
     cpdef unmarshall(self)
 
+    @cython.locals(
+        objects=cython.dict,
+        object_interfaces=cython.dict,
+        path=cython.str,
+        interface=cython.str,
+        objects_end=cython.ulong,
+        interfaces_start=cython.ulong,
+        interfaces_end=cython.ulong,
+        properties_start=cython.ulong,
+        properties_end=cython.ulong,
+    )
+    cdef cython.dict _read_managed_objects(self, str path_prefix, object interfaces)
+
     @cython.locals(
         beginning_pos=cython.ulong,
         o=cython.ulong,
@@ -4,7 +4,7 @@ import io
 import socket
 import sys
 from struct import Struct
-from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
 
 from ..constants import MESSAGE_FLAG_MAP, MESSAGE_TYPE_MAP, MessageFlag
 from ..errors import InvalidMessageError
@@ -140,10 +140,77 @@ _int = int
 
 READER_TYPE = Callable[["Unmarshaller", SignatureType], Any]
 
+# (path prefix, interfaces or None for all) to decode of an a{oa{sa{sv}}} reply
+MANAGED_OBJECTS_FILTER_TYPE = Tuple[str, Optional[FrozenSet[str]]]
+
 MARSHALL_STREAM_END_ERROR = BlockingIOError
 
 DEFAULT_BUFFER_SIZE = io.DEFAULT_BUFFER_SIZE
 
+STRING_CACHE_SIZE = 1024  # entries
+STRING_CACHE_MAX_LENGTH = 128  # bytes, longer strings are decoded every time
+
+
+class StringCache:
+    """Bounded cache of decoded strings.
+
+    Header fields and dictionary keys come from a small vocabulary of object
+    paths, interfaces, members and property names. Every read still decodes
+    the string: looking it up by the raw bytes first was measured slower on
+    CPython, since the buffer is a bytearray that cannot be hashed without a
+    copy. What the cache buys is one long-lived object per string, with its
+    hash computed once for the dict lookups that follow. Strings
+    ``pin``-ned by the bus and its proxies come back as the very object they
+    are compared with, so matching a signal succeeds on identity. Once full
+    the cache starts over, keeping only the pinned strings, so strings that
+    stopped coming back do not hold on to it.
+    """
+
+    __slots__ = ("strings", "pinned", "max_size", "hits", "misses", "resets")
+
+    def __init__(self, max_size: int = STRING_CACHE_SIZE) -> None:
+        self.strings: Dict[str, str] = {}
+        self.pinned: Dict[str, str] = {}
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.resets = 0
+
+    def get(self, string: str) -> str:
+        cached = self.strings.get(string)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        if len(self.strings) >= self.max_size:
+            self.strings.clear()
+            self.strings.update(self.pinned)
+            self.resets += 1
+        self.strings[string] = string
+        return string
+
+    def pin(self, string: str) -> str:
+        """Return the object decoded messages will carry for ``string``, kept across resets."""
+        if len(string.encode()) > STRING_CACHE_MAX_LENGTH:
+            return string
+        pinned = self.pinned.get(string)
+        if pinned is None:
+            pinned = self.pinned[string] = self.strings.setdefault(string, string)
+        self.strings[pinned] = pinned
+        return pinned
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self.strings),
+            "pinned": len(self.pinned),
+            "hits": self.hits,
+            "misses": self.misses,
+            "resets": self.resets,
+        }
+
+
+STRING_CACHE = StringCache()
+
 
 def unpack_parser_factory(unpack_from: Callable, size: int) -> READER_TYPE:
     """Build a parser that unpacks the bytes using the given unpack_from function."""
@@ -223,6 +290,8 @@ class Unmarshaller:
         "_negotiate_unix_fd",
         "_read_complete",
         "_endian",
+        "_body_filters",
+        "_buf_end",
     )
 
     def __init__(
@@ -230,9 +299,13 @@ class Unmarshaller:
         stream: Optional[io.BufferedRWPair] = None,
         sock: Optional[socket.socket] = None,
         negotiate_unix_fd: bool = True,
+        body_filters: Optional[Dict[int, MANAGED_OBJECTS_FILTER_TYPE]] = None,
     ) -> None:
         self._unix_fds: List[int] = []
-        self._buf = bytearray()  # Actual buffer
+        # The current message always starts at offset 0, the bytes past
+        # _buf_end are spare room that socket reads land in directly.
+        self._buf = bytearray(DEFAULT_BUFFER_SIZE)
+        self._buf_end = 0
         self._stream = stream
         self._sock = sock
         self._message: Optional[Message] = None
@@ -256,10 +329,12 @@ class Unmarshaller:
                 self._stream_reader = stream.reader.read  # type: ignore[attr-defined]
             self._stream_reader = stream.read
         elif self._negotiate_unix_fd:
-            self._sock_reader = self._sock.recvmsg
+            self._sock_reader = self._sock.recvmsg_into
         else:
-            self._sock_reader = self._sock.recv
+            self._sock_reader = self._sock.recv_into
         self._endian = 0
+        # filters for the a{oa{sa{sv}}} replies to these serials, owned by the bus
+        self._body_filters = body_filters
 
     def _next_message(self) -> None:
         """Reset the unmarshaller to its initial state.
@@ -268,10 +343,12 @@ class Unmarshaller:
         """
         self._unix_fds = []
         to_clear = HEADER_SIGNATURE_SIZE + self._msg_len
-        if len(self._buf) == to_clear:
-            self._buf = bytearray()
-        else:
+        remaining = self._buf_end - to_clear
+        if remaining:
+            # bytearray drops a prefix by advancing its start, the data is
+            # only moved once _reserve grows the buffer again
             del self._buf[:to_clear]
+        self._buf_end = remaining
         self._msg_len = 0  # used to check if we have ready the header
         self._read_complete = False  # used to check if we have ready the message
         # No need to reset the unpack functions, they are set in _read_header
@@ -286,7 +363,13 @@ class Unmarshaller:
 
     def _has_another_message_in_buffer(self) -> bool:
         """Check if there is another message in the buffer."""
-        return len(self._buf) > HEADER_SIGNATURE_SIZE + self._msg_len
+        return self._buf_end > HEADER_SIGNATURE_SIZE + self._msg_len
+
+    def _reserve(self, size: _int) -> None:
+        """Make room for at least size bytes past the end of the data."""
+        missing = self._buf_end + size - len(self._buf)
+        if missing > 0:
+            self._buf += bytes(max(missing, len(self._buf)))  # at least double
 
     def _read_sock_with_fds(self, pos: _int, missing_bytes: _int) -> None:
         """reads from the socket, storing any fds sent and handling errors
@@ -297,14 +380,18 @@ class Unmarshaller:
         """
         # This will raise BlockingIOError if there is no data to read
         # which we store in the MARSHALL_STREAM_END_ERROR object
+        self._reserve(missing_bytes)
         try:
-            recv = self._sock_reader(missing_bytes, UNIX_FDS_CMSG_LENGTH)  # type: ignore[union-attr]
+            recv = self._sock_reader(  # type: ignore[union-attr]
+                (memoryview(self._buf)[self._buf_end : self._buf_end + missing_bytes],),
+                UNIX_FDS_CMSG_LENGTH,
+            )
         except OSError as e:
             errno = e.errno
             if errno == EAGAIN or errno == EWOULDBLOCK:
                 raise MARSHALL_STREAM_END_ERROR
             raise
-        msg = recv[0]
+        read = recv[0]
         ancdata = recv[1]
         if ancdata:
             for level, type_, data in ancdata:
@@ -313,10 +400,10 @@ class Unmarshaller:
                 self._unix_fds.extend(
                     ARRAY("i", data[: len(data) - (len(data) % MAX_UNIX_FDS_SIZE)])
                 )
-        if not msg:
+        if not read:
             raise EOFError()
-        self._buf += msg
-        if len(self._buf) < pos:
+        self._buf_end += read
+        if self._buf_end < pos:
             raise MARSHALL_STREAM_END_ERROR
 
     def _read_sock_without_fds(self, pos: _int) -> None:
@@ -328,17 +415,22 @@ class Unmarshaller:
         # This will raise BlockingIOError if there is no data to read
         # which we store in the MARSHALL_STREAM_END_ERROR object
         while True:
+            # bounded reads keep what _next_message has to move small
+            size = max(pos - self._buf_end, DEFAULT_BUFFER_SIZE)
+            self._reserve(size)
             try:
-                data = self._sock_reader(DEFAULT_BUFFER_SIZE)  # type: ignore[union-attr]
+                read = self._sock_reader(  # type: ignore[union-attr]
+                    memoryview(self._buf)[self._buf_end : self._buf_end + size]
+                )
             except OSError as e:
                 errno = e.errno
                 if errno == EAGAIN or errno == EWOULDBLOCK:
                     raise MARSHALL_STREAM_END_ERROR
                 raise
-            if not data:
+            if not read:
                 raise EOFError()
-            self._buf += data
-            if len(self._buf) >= pos:
+            self._buf_end += read
+            if self._buf_end >= pos:
                 return
 
     def _read_stream(self, pos: _int, missing_bytes: _int) -> bytes:
@@ -348,8 +440,10 @@ class Unmarshaller:
             raise MARSHALL_STREAM_END_ERROR
         if not data:
             raise EOFError()
-        self._buf += data
-        if len(self._buf) < pos:
+        self._reserve(len(data))
+        self._buf[self._buf_end : self._buf_end + len(data)] = data
+        self._buf_end += len(data)
+        if self._buf_end < pos:
             raise MARSHALL_STREAM_END_ERROR
 
     def _read_to_pos(self, pos: _int) -> None:
@@ -365,7 +459,7 @@ class Unmarshaller:
         :returns:
             None
         """
-        missing_bytes = pos - len(self._buf)
+        missing_bytes = pos - self._buf_end
         if missing_bytes <= 0:
             return
         if self._sock is None:
@@ -430,6 +524,22 @@ class Unmarshaller:
             self._pos += self._uint32_unpack(self._buf, str_start - UINT32_SIZE)[0] + 1  # type: ignore[misc]
         return self._buf[str_start : self._pos - 1].decode()
 
+    def _read_string_interned(self) -> str:
+        """Read a string, returning the cached object for repeated short strings."""
+        self._pos += UINT32_SIZE + (-self._pos & (UINT32_SIZE - 1))  # align
+        str_start = self._pos
+        if self._is_native and cython.compiled:
+            str_length = _cast_uint32_native(  # type: ignore[name-defined] # pragma: no cover
+                self._buf, str_start - UINT32_SIZE
+            )
+        else:
+            str_length = self._uint32_unpack(self._buf, str_start - UINT32_SIZE)[0]  # type: ignore[misc]
+        # read terminating '\0' byte as well (str_length + 1)
+        self._pos += str_length + 1
+        if str_length > STRING_CACHE_MAX_LENGTH:
+            return self._buf[str_start : self._pos - 1].decode()
+        return STRING_CACHE.get(self._buf[str_start : self._pos - 1].decode())
+
     def read_signature(self, type_: _SignatureType) -> str:
         return self._read_signature()
 
@@ -555,7 +665,7 @@ class Unmarshaller:
             ) and child_1_token_as_int == TOKEN_V_AS_INT:
                 while self._pos - beginning_pos < array_length:
                     self._pos += -self._pos & 7  # align 8
-                    key: Union[str, int] = self._read_string_unpack()
+                    key: Union[str, int] = self._read_string_interned()
                     result_dict[key] = self._read_variant()
             elif (
                 child_0_token_as_int == TOKEN_Q_AS_INT
@@ -571,7 +681,7 @@ class Unmarshaller:
             ) and child_1_token_as_int == TOKEN_A_AS_INT:
                 while self._pos - beginning_pos < array_length:
                     self._pos += -self._pos & 7  # align 8
-                    key = self._read_string_unpack()
+                    key = self._read_string_interned()
                     result_dict[key] = self.read_array(child_1)
             else:
                 reader_1 = self._readers[child_1.token]
@@ -597,6 +707,53 @@ class Unmarshaller:
             result_list.append(reader(self, child_type))
         return result_list
 
+    def _read_managed_objects(
+        self, path_prefix: str, interfaces: Optional[FrozenSet[str]]
+    ) -> Dict[str, Dict[str, Dict[str, Variant]]]:
+        """Read an a{oa{sa{sv}}} ObjectManager reply, decoding only the objects
+        under path_prefix and, if given, only the listed interfaces of those.
+
+        Everything else is skipped by its array length without being decoded.
+        """
+        objects: Dict[str, Dict[str, Dict[str, Variant]]] = {}
+        objects_end = self._read_uint32_unpack()
+        self._pos += -self._pos & 7  # align 8
+        objects_end += self._pos
+        while self._pos < objects_end:
+            self._pos += -self._pos & 7  # align 8
+            # only the paths that are kept are interned, see below
+            path = self._read_string_unpack()
+            interfaces_start = self._pos
+            interfaces_end = self._read_uint32_unpack()
+            self._pos += -self._pos & 7  # align 8
+            interfaces_end += self._pos
+            if not path.startswith(path_prefix):
+                self._pos = interfaces_end
+                continue
+            path = STRING_CACHE.get(path)
+            if interfaces is None:
+                self._pos = interfaces_start
+                objects[path] = self.read_array(SIGNATURE_TREE_OA_SA_SV_TYPES_1)
+                continue
+            # objects keep their path even when none of their interfaces is wanted
+            object_interfaces: Dict[str, Dict[str, Variant]] = {}
+            while self._pos < interfaces_end:
+                self._pos += -self._pos & 7  # align 8
+                interface = self._read_string_interned()
+                properties_start = self._pos
+                properties_end = self._read_uint32_unpack()
+                self._pos += -self._pos & 7  # align 8
+                properties_end += self._pos
+                if interface in interfaces:
+                    self._pos = properties_start
+                    object_interfaces[interface] = self.read_array(
+                        SIGNATURE_TREE_A_SV_TYPES_0
+                    )
+                else:
+                    self._pos = properties_end
+            objects[path] = object_interfaces
+        return objects
+
     def _header_fields(self, header_length: _int) -> Dict[str, Any]:
         """Header fields are always a(yv)."""
         beginning_pos = self._pos
@@ -621,9 +778,12 @@ class Unmarshaller:
             # Strings and signatures are the most common types
             # so we inline them for performance
             if token_as_int == TOKEN_O_AS_INT or token_as_int == TOKEN_S_AS_INT:
-                headers[key] = self._read_string_unpack()
+                headers[key] = self._read_string_interned()
             elif token_as_int == TOKEN_G_AS_INT:
-                headers[key] = self._read_signature()
+                signature_len = buf[self._pos]
+                o = self._pos + 1
+                self._pos = o + signature_len + 1
+                headers[key] = STRING_CACHE.get(buf[o : o + signature_len].decode())
             else:
                 token = buf[o : o + signature_len].decode()
                 # There shouldn't be any other types in the header
@@ -732,7 +892,15 @@ class Unmarshaller:
                 ]
             elif token_as_int == TOKEN_A_AS_INT and signature == "a{oa{sa{sv}}}":
                 tree = SIGNATURE_TREE_A_OA_SA_SV
-                body = [self.read_array(SIGNATURE_TREE_A_OA_SA_SV_TYPES_0)]
+                body_filter = (
+                    self._body_filters.get(header_fields.get("reply_serial", 0))
+                    if self._body_filters
+                    else None
+                )
+                if body_filter is None:
+                    body = [self.read_array(SIGNATURE_TREE_A_OA_SA_SV_TYPES_0)]
+                else:
+                    body = [self._read_managed_objects(body_filter[0], body_filter[1])]
             else:
                 tree = get_signature_tree(signature)
                 body = [self._readers[t.token](self, t) for t in tree.types]
@@ -5,9 +5,10 @@ import socket
 from collections import deque
 from copy import copy
 from functools import partial
-from typing import Any, Callable, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from .. import introspection as intr
+from .._private.unmarshaller import MANAGED_OBJECTS_FILTER_TYPE
 from ..auth import Authenticator, AuthExternal
 from ..constants import (
     BusType,
@@ -20,12 +21,17 @@ from ..constants import (
 from ..errors import AuthError
 from ..message import Message
 from ..message_bus import BaseMessageBus, _block_unexpected_reply
+from ..proxy_object import BaseProxyInterface
 from ..service import ServiceInterface
+from ..signature import Variant
 from .message_reader import build_message_reader
 from .proxy_object import ProxyObject
 
 NO_REPLY_EXPECTED_VALUE = MessageFlag.NO_REPLY_EXPECTED.value
 
+# buffers per sendmsg call, two per message and well below IOV_MAX
+SENDMSG_MAX_BUFFERS = 64
+
 
 def _generate_hello_serialized(next_serial: int) -> bytes:
     return Message(
@@ -51,81 +57,104 @@ def _future_set_result(fut: asyncio.Future, result: Any) -> None:
 
 
 class _MessageWriter:
-    """A class to handle writing messages to the message bus."""
+    """A class to handle writing messages to the message bus.
+
+    Each queued message is a header and a body buffer. Consecutive messages
+    without unix fds are flushed together with one ``sendmsg`` call, a message
+    with fds is sent on its own so the fds travel with its first byte.
+    """
 
     def __init__(self, bus: "MessageBus") -> None:
         """A class to handle writing messages to the message bus."""
         self.messages: deque[
-            Tuple[bytearray, Optional[List[int]], Optional[asyncio.Future]]
+            List[Any]  # [buffers, unix_fds, future]
         ] = deque()
         self.negotiate_unix_fd = bus._negotiate_unix_fd
         self.bus = bus
         self.sock = bus._sock
         self.loop = bus._loop
-        self.buf: Optional[memoryview] = None
         self.fd = bus._fd
-        self.offset = 0
-        self.unix_fds: Optional[List[int]] = None
-        self.fut: Optional[asyncio.Future] = None
 
     def write_callback(self, remove_writer: bool = True) -> None:
         """The callback to write messages to the message bus."""
         sock = self.sock
+        messages = self.messages
         try:
-            while True:
-                if self.buf is None:
-                    # If there is no buffer, get the next message
-                    if not self.messages:
-                        # nothing more to write
-                        if remove_writer:
-                            self.loop.remove_writer(self.fd)
-                        return
-
-                    # Get the next message
-                    buf, unix_fds, fut = self.messages.popleft()
-                    self.unix_fds = unix_fds
-                    self.buf = memoryview(buf)
-                    self.offset = 0
-                    self.fut = fut
-
-                if self.unix_fds and self.negotiate_unix_fd:
+            while messages:
+                buffers, unix_fds, _ = messages[0]
+                if unix_fds and self.negotiate_unix_fd:
                     ancdata = [
                         (
                             socket.SOL_SOCKET,
                             socket.SCM_RIGHTS,
-                            array.array("i", self.unix_fds),
+                            array.array("i", unix_fds),
                         )
                     ]
-                    self.offset += sock.sendmsg([self.buf[self.offset :]], ancdata)
-                    self.unix_fds = None
+                    sent = sock.sendmsg(buffers, ancdata)
+                    messages[0][1] = None
                 else:
-                    self.offset += sock.send(self.buf[self.offset :])
+                    buffers = self._gather()
+                    sent = sock.sendmsg(buffers)
 
-                if self.offset < len(self.buf):
+                # the queue may hold more than was handed to sendmsg
+                partial = sent < sum(map(len, buffers))
+                self._advance(sent)
+                if partial:
                     # wait for writable
                     return
 
-                # finished writing
-                self.buf = None
-                _future_set_result(self.fut, None)
+            # nothing more to write
+            if remove_writer:
+                self.loop.remove_writer(self.fd)
+        except BlockingIOError:
+            # socket buffer is full, wait for writable
+            return
         except Exception as e:
+            fut = messages[0][2] if messages else None
             if self.bus._user_disconnect:
-                _future_set_result(self.fut, None)
+                _future_set_result(fut, None)
             else:
-                _future_set_exception(self.fut, e)
+                _future_set_exception(fut, e)
             self.bus._finalize(e)
 
+    def _gather(self) -> List[memoryview]:
+        """Buffers of the queued messages up to the next one carrying fds."""
+        buffers: List[memoryview] = []
+        negotiate_unix_fd = self.negotiate_unix_fd
+        for message_buffers, unix_fds, _ in self.messages:
+            if (unix_fds and negotiate_unix_fd) or len(
+                buffers
+            ) >= SENDMSG_MAX_BUFFERS:
+                break
+            buffers.extend(message_buffers)
+        return buffers
+
+    def _advance(self, sent: int) -> None:
+        """Drop ``sent`` bytes from the queue and resolve the futures of the
+        messages written completely."""
+        messages = self.messages
+        while messages:
+            buffers = messages[0][0]
+            while buffers and len(buffers[0]) <= sent:
+                sent -= len(buffers.pop(0))
+            if buffers:
+                if sent:
+                    buffers[0] = buffers[0][sent:]
+                return
+            _future_set_result(messages.popleft()[2], None)
+
     def buffer_message(
         self, msg: Message, future: Optional[asyncio.Future] = None
     ) -> None:
         """Buffer a message to be sent later."""
         unix_fds = msg.unix_fds
+        header, body = msg._marshall_parts(self.negotiate_unix_fd)
         self.messages.append(
-            (
-                msg._marshall(self.negotiate_unix_fd),
+            [
+                [memoryview(header), memoryview(body)],
                 copy(unix_fds) if unix_fds else None,
                 future,
-            )
+            ]
         )
 
     def _write_without_remove_writer(self) -> None:
@@ -148,12 +177,7 @@ class _MessageWriter:
             if queue_is_empty:
                 self._write_without_remove_writer()
 
-            if (
-                self.buf is not None
-                or self.messages
-                or not self.fut
-                or not self.fut.done()
-            ):
+            if self.messages:
                 self.loop.add_writer(self.fd, self.write_callback)
 
 
@@ -187,7 +211,14 @@ class MessageBus(BaseMessageBus):
     :vartype connected: bool
     """
 
-    __slots__ = ("_loop", "_auth", "_writer", "_disconnect_future", "_pending_futures")
+    __slots__ = (
+        "_loop",
+        "_auth",
+        "_writer",
+        "_disconnect_future",
+        "_pending_futures",
+        "_body_filters",
+    )
 
     def __init__(
         self,
@@ -208,6 +239,7 @@ class MessageBus(BaseMessageBus):
 
         self._disconnect_future = self._loop.create_future()
         self._pending_futures: Set[asyncio.Future] = set()
+        self._body_filters: Dict[int, MANAGED_OBJECTS_FILTER_TYPE] = {}
 
     async def connect(self) -> "MessageBus":
         """Connect this message bus to the DBus daemon.
@@ -233,6 +265,7 @@ class MessageBus(BaseMessageBus):
                 self._process_message,
                 self._finalize,
                 self._negotiate_unix_fd,
+                self._body_filters,
             ),
         )
 
@@ -356,11 +389,15 @@ class MessageBus(BaseMessageBus):
 
         return await future
 
-    async def call(self, msg: Message) -> Optional[Message]:
+    async def call(
+        self, msg: Message, timeout: Optional[float] = None
+    ) -> Optional[Message]:
         """Send a method call and wait for a reply from the DBus daemon.
 
         :param msg: The method call message to send.
         :type msg: :class:`Message <dbus_fast.Message>`
+        :param timeout: Seconds to wait for the reply, or ``None`` to wait forever.
+        :type timeout: float
 
         :returns: A message in reply to the message sent. If the message does
             not expect a reply based on the message flags or type, returns
@@ -369,6 +406,7 @@ class MessageBus(BaseMessageBus):
 
         :raises:
             - :class:`Exception` - If a connection error occurred.
+            - :class:`asyncio.TimeoutError` - Waited for the reply but time run out.
         """
         if (
             msg.flags.value & NO_REPLY_EXPECTED_VALUE
@@ -381,10 +419,76 @@ class MessageBus(BaseMessageBus):
 
         self._call(msg, partial(self._reply_handler, future))
 
-        await future
+        if timeout is None:
+            await future
+            return future.result()
+
+        timer_handle = self._loop.call_later(
+            timeout, _future_set_exception, future, asyncio.TimeoutError
+        )
+        try:
+            await future
+        except asyncio.TimeoutError:
+            # a late reply must not find a handler waiting for it
+            self._method_return_handlers.pop(msg.serial, None)
+            raise
+        finally:
+            timer_handle.cancel()
 
         return future.result()
 
+    async def get_managed_objects(
+        self,
+        bus_name: str,
+        path: str = "/",
+        path_prefix: str = "/",
+        interfaces: Optional[Iterable[str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Dict[str, Dict[str, Variant]]]:
+        """Call ``org.freedesktop.DBus.ObjectManager.GetManagedObjects`` and
+        decode only part of the reply.
+
+        Objects outside ``path_prefix`` are skipped without being decoded, as
+        are interfaces not in ``interfaces`` when it is given. Objects under
+        the prefix keep their path even when none of their interfaces is
+        decoded.
+
+        :param bus_name: The name of the object manager.
+        :type bus_name: str
+        :param path: The path of the object manager.
+        :type path: str
+        :param path_prefix: The prefix of the paths of the objects to decode.
+        :type path_prefix: str
+        :param interfaces: The interfaces to decode, or ``None`` for all.
+        :param timeout: Seconds to wait for the reply, or ``None`` to wait forever.
+        :type timeout: float
+
+        :returns: The managed objects, like the unfiltered method call.
+
+        :raises:
+            - :class:`DBusError <dbus_fast.DBusError>` - If the service threw \
+                  an error for the method call or returned an invalid result.
+            - :class:`Exception` - If a connection error occurred.
+            - :class:`asyncio.TimeoutError` - Waited for the reply but time run out.
+        """
+        msg = Message(
+            destination=bus_name,
+            path=path,
+            interface="org.freedesktop.DBus.ObjectManager",
+            member="GetManagedObjects",
+            serial=self.next_serial(),
+        )
+        self._body_filters[msg.serial] = (
+            path_prefix,
+            None if interfaces is None else frozenset(interfaces),
+        )
+        try:
+            reply = await self.call(msg, timeout)
+        finally:
+            self._body_filters.pop(msg.serial, None)
+        BaseProxyInterface._check_method_return(reply, "a{oa{sa{sv}}}")
+        return reply.body[0]
+
     def send(self, msg: Message) -> asyncio.Future:
         """Asynchronously send a message on the message bus.
 
@@ -1,9 +1,9 @@
 import logging
 import socket
 from functools import partial
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional
 
-from .._private.unmarshaller import Unmarshaller
+from .._private.unmarshaller import MANAGED_OBJECTS_FILTER_TYPE, Unmarshaller
 from ..message import Message
 
 
@@ -39,7 +39,8 @@ def build_message_reader(
     process: Callable[[Message], None],
     finalize: Callable[[Optional[Exception]], None],
     negotiate_unix_fd: bool,
+    body_filters: Optional[Dict[int, MANAGED_OBJECTS_FILTER_TYPE]] = None,
 ) -> Callable[[], None]:
     """Build a callable that reads messages from the unmarshaller and passes them to the process function."""
-    unmarshaller = Unmarshaller(None, sock, negotiate_unix_fd)
+    unmarshaller = Unmarshaller(None, sock, negotiate_unix_fd, body_filters)
     return partial(_message_reader, unmarshaller, process, finalize, negotiate_unix_fd)
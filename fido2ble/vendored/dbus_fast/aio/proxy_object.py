@@ -1,20 +1,21 @@
 import xml.etree.ElementTree as ET
-from typing import TYPE_CHECKING, Any, List, Union
+from typing import TYPE_CHECKING, Any, List, Optional, Union
 
 from .. import introspection as intr
 from .._private.util import replace_fds_with_idx, replace_idx_with_fds
-from ..constants import ErrorType, MessageFlag
+from ..constants import ErrorType, MessageFlag, MessageType
 from ..errors import DBusError
 from ..message import Message
 from ..message_bus import BaseMessageBus
 from ..proxy_object import BaseProxyInterface, BaseProxyObject
-from ..signature import Variant
+from ..signature import Variant, get_signature_tree
 from ..unpack import unpack_variants as unpack
 
 if TYPE_CHECKING:
     from .message_bus import MessageBus as AioMessageBus
 
 NO_REPLY_EXPECTED_VALUE = MessageFlag.NO_REPLY_EXPECTED.value
+METHOD_RETURN = MessageType.METHOD_RETURN
 
 
 class ProxyInterface(BaseProxyInterface):
@@ -82,8 +83,17 @@ class ProxyInterface(BaseProxyInterface):
     bus: "AioMessageBus"
 
     def _add_method(self, intr_method: intr.Method) -> None:
+        if self._fd_free(intr_method.in_signature) and self._fd_free(
+            intr_method.out_signature
+        ):
+            self._add_fd_free_method(intr_method)
+            return
+
         async def method_fn(
-            *args, flags=MessageFlag.NONE, unpack_variants: bool = False
+            *args,
+            flags=MessageFlag.NONE,
+            unpack_variants: bool = False,
+            timeout: Optional[float] = None,
         ):
             input_body, unix_fds = replace_fds_with_idx(
                 intr_method.in_signature, list(args)
@@ -99,7 +109,8 @@ class ProxyInterface(BaseProxyInterface):
                     body=input_body,
                     flags=flags,
                     unix_fds=unix_fds,
-                )
+                ),
+                timeout,
             )
 
             if flags is not None and flags.value & NO_REPLY_EXPECTED_VALUE:
@@ -124,12 +135,70 @@ class ProxyInterface(BaseProxyInterface):
         method_name = f"call_{BaseProxyInterface._to_snake_case(intr_method.name)}"
         setattr(self, method_name, method_fn)
 
+    def _add_fd_free_method(self, intr_method: intr.Method) -> None:
+        """The stub for methods without fds in or out, most of BlueZ.
+
+        Everything derived from the introspection data is looked up once here
+        instead of on every call, the names were validated when parsing it.
+        """
+        bus = self.bus
+        destination = self.bus_name
+        path = self.path
+        interface = self.introspection.name
+        member = intr_method.name
+        in_signature_tree = get_signature_tree(intr_method.in_signature)
+        out_signature = intr_method.out_signature
+        out_len = len(intr_method.out_args)
+
+        async def method_fn(
+            *args,
+            flags=MessageFlag.NONE,
+            unpack_variants: bool = False,
+            timeout: Optional[float] = None,
+        ):
+            msg = await bus.call(
+                Message(
+                    destination=destination,
+                    path=path,
+                    interface=interface,
+                    member=member,
+                    signature=in_signature_tree,
+                    body=list(args),
+                    flags=flags,
+                    validate=False,
+                ),
+                timeout,
+            )
+
+            if flags is not None and flags.value & NO_REPLY_EXPECTED_VALUE:
+                return None
+
+            if msg.message_type is not METHOD_RETURN or msg.signature != out_signature:
+                BaseProxyInterface._check_method_return(msg, out_signature)
+
+            if not out_len:
+                return None
+
+            body = msg.body
+            if unpack_variants:
+                body = unpack(body)
+
+            if out_len == 1:
+                return body[0]
+            return body
+
+        method_name = f"call_{BaseProxyInterface._to_snake_case(intr_method.name)}"
+        setattr(self, method_name, method_fn)
+
     def _add_property(
         self,
         intr_property: intr.Property,
     ) -> None:
         async def property_getter(
-            *, flags=MessageFlag.NONE, unpack_variants: bool = False
+            *,
+            flags=MessageFlag.NONE,
+            unpack_variants: bool = False,
+            timeout: Optional[float] = None,
         ):
             msg = await self.bus.call(
                 Message(
@@ -139,7 +208,8 @@ class ProxyInterface(BaseProxyInterface):
                     member="Get",
                     signature="ss",
                     body=[self.introspection.name, intr_property.name],
-                )
+                ),
+                timeout,
             )
 
             BaseProxyInterface._check_method_return(msg, "v")
@@ -157,7 +227,7 @@ class ProxyInterface(BaseProxyInterface):
                 return unpack(body)
             return body
 
-        async def property_setter(val: Any) -> None:
+        async def property_setter(val: Any, *, timeout: Optional[float] = None) -> None:
             variant = Variant(intr_property.signature, val)
 
             body, unix_fds = replace_fds_with_idx(
@@ -173,7 +243,8 @@ class ProxyInterface(BaseProxyInterface):
                     signature="ssv",
                     body=body,
                     unix_fds=unix_fds,
-                )
+                ),
+                timeout,
             )
 
             BaseProxyInterface._check_method_return(msg)
@@ -26,6 +26,10 @@ cdef object HEADER_UNIX_FDS
 cdef object LITTLE_ENDIAN
 cdef object PROTOCOL_VERSION
 
+cdef object PACK_LENGTH_AND_SERIAL
+cdef unsigned int HEADER_TEMPLATE_CACHE_SIZE
+cdef dict _header_templates
+
 cdef object MESSAGE_FLAG
 cdef object MESSAGE_FLAG_NONE
 cdef object MESSAGE_TYPE_METHOD_CALL
@@ -50,7 +54,21 @@ cdef class Message:
     cdef public object serial
 
     @cython.locals(
-        body_buffer=cython.bytearray,
-        header_buffer=cython.bytearray
+        header_buffer=cython.bytearray,
+        body_buffer=cython.bytearray
     )
     cpdef _marshall(self, object negotiate_unix_fd)
+
+    @cython.locals(
+        body_buffer=cython.bytearray,
+        header_buffer=cython.bytearray,
+        template=cython.bytes,
+        key=cython.tuple
+    )
+    cpdef _marshall_parts(self, object negotiate_unix_fd)
+
+    @cython.locals(
+        fields=cython.list,
+        header_block=Marshaller
+    )
+    cdef bytearray _marshall_header(self, object negotiate_unix_fd, unsigned int body_length, unsigned int serial)
@@ -1,4 +1,5 @@
-from typing import Any, List, Optional, Union
+from struct import Struct
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from ._private.constants import LITTLE_ENDIAN, PROTOCOL_VERSION, HeaderField
 from ._private.marshaller import Marshaller
@@ -28,6 +29,13 @@ HEADER_DESTINATION = HeaderField.DESTINATION.value
 HEADER_SIGNATURE = HeaderField.SIGNATURE.value
 HEADER_UNIX_FDS = HeaderField.UNIX_FDS.value
 
+# body length and serial, the only header bytes that differ between
+# messages sharing a template
+PACK_LENGTH_AND_SERIAL = Struct("<II").pack_into
+HEADER_TEMPLATE_CACHE_SIZE = 256
+
+_header_templates: Dict[Tuple[Any, ...], bytes] = {}
+
 MESSAGE_FLAG = MessageFlag
 
 MESSAGE_FLAG_NONE = MessageFlag.NONE
@@ -277,10 +285,56 @@ class Message:
 
     def _marshall(self, negotiate_unix_fd: bool) -> bytearray:
         """Marshall this message into a byte array."""
+        header_buffer, body_buffer = self._marshall_parts(negotiate_unix_fd)
+        return header_buffer + body_buffer
+
+    def _marshall_parts(
+        self, negotiate_unix_fd: bool
+    ) -> Tuple[bytearray, bytearray]:
+        """Marshall this message into a header and a body, ready for a
+        scatter-gather write.
+
+        Headers of method calls and signals only depend on the addressing
+        fields, so they are marshalled once per destination, path, interface,
+        member and signature and the body length and serial are patched into a
+        copy. Replies, errors and messages carrying fds are marshalled in full.
+        """
         # TODO maximum message size is 134217728 (128 MiB)
         body_block = Marshaller(self.signature, self.body)
         body_buffer = body_block._marshall()
 
+        if self.reply_serial or self.error_name or (
+            self.unix_fds and negotiate_unix_fd
+        ):
+            return (
+                self._marshall_header(
+                    negotiate_unix_fd, len(body_buffer), self.serial
+                ),
+                body_buffer,
+            )
+
+        key = (
+            self.message_type.value,
+            self.flags.value,
+            self.destination,
+            self.path,
+            self.interface,
+            self.member,
+            self.signature,
+        )
+        template = _header_templates.get(key)
+        if template is None:
+            if len(_header_templates) >= HEADER_TEMPLATE_CACHE_SIZE:
+                _header_templates.clear()
+            template = bytes(self._marshall_header(negotiate_unix_fd, 0, 0))
+            _header_templates[key] = template
+        header_buffer = bytearray(template)
+        PACK_LENGTH_AND_SERIAL(header_buffer, 4, len(body_buffer), self.serial)
+        return header_buffer, body_buffer
+
+    def _marshall_header(
+        self, negotiate_unix_fd: bool, body_length: int, serial: int
+    ) -> bytearray:
         fields = []
 
         # No verify here since the marshaller will raise an exception if the
@@ -308,12 +362,11 @@ class Message:
             self.message_type.value,
             self.flags.value,
             PROTOCOL_VERSION,
-            len(body_buffer),
-            self.serial,
+            body_length,
+            serial,
             fields,
         ]
         header_block = Marshaller("yyyyuua(yv)", header_body)
         header_block._marshall()
         header_block._align(8)
-        header_buffer = header_block._buffer()
-        return header_buffer + body_buffer
+        return header_block._buffer()
@@ -33,6 +33,7 @@ cdef class BaseMessageBus:
     cdef public cython.dict _path_exports
     cdef public cython.list _user_message_handlers
     cdef public cython.dict _name_owners
+    cdef public cython.dict _proxy_interfaces
     cdef public object _bus_address
     cdef public object _name_owner_match_rule
     cdef public cython.dict _match_rules
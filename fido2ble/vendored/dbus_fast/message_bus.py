@@ -4,10 +4,11 @@ import socket
 import traceback
 import xml.etree.ElementTree as ET
 from functools import partial
-from typing import Any, Callable, Dict, List, Optional, Type, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
 
 from . import introspection as intr
 from ._private.address import get_bus_address, parse_address
+from ._private.unmarshaller import STRING_CACHE
 from ._private.util import replace_fds_with_idx, replace_idx_with_fds
 from .constants import (
     BusType,
@@ -20,7 +21,7 @@ from .constants import (
 )
 from .errors import DBusError, InvalidAddressError
 from .message import Message
-from .proxy_object import BaseProxyObject
+from .proxy_object import BaseProxyInterface, BaseProxyObject
 from .send_reply import SendReply
 from .service import ServiceInterface, _Method
 from .signature import Variant
@@ -32,6 +33,10 @@ NO_REPLY_EXPECTED_VALUE = MessageFlag.NO_REPLY_EXPECTED.value
 NO_REPLY_EXPECTED = MessageFlag.NO_REPLY_EXPECTED
 NONE = MessageFlag.NONE
 _LOGGER = logging.getLogger(__name__)
+# the strings NameOwnerChanged is matched with, decoded signals carry these very objects
+_DBUS_NAME = STRING_CACHE.pin("org.freedesktop.DBus")
+_DBUS_PATH = STRING_CACHE.pin("/org/freedesktop/DBus")
+_NAME_OWNER_CHANGED = STRING_CACHE.pin("NameOwnerChanged")
 
 
 _Message = Message
@@ -104,6 +109,7 @@ class BaseMessageBus:
         "_serial",
         "_user_message_handlers",
         "_name_owners",
+        "_proxy_interfaces",
         "_path_exports",
         "_bus_address",
         "_name_owner_match_rule",
@@ -144,6 +150,9 @@ class BaseMessageBus:
         # used to route messages to the correct proxy object. (used for the
         # high level client only)
         self._name_owners: Dict[str, str] = {}
+        # interned proxy interfaces by bus name, path and interface name (used
+        # for the high level client only)
+        self._proxy_interfaces: Dict[Tuple[str, str, str], BaseProxyInterface] = {}
         # used for the high level service
         self._path_exports: Dict[str, list[ServiceInterface]] = {}
         self._bus_address = (
@@ -827,10 +836,10 @@ class BaseMessageBus:
 
         if msg.message_type is MESSAGE_TYPE_SIGNAL:
             if (
-                msg.member == "NameOwnerChanged"
-                and msg.sender == "org.freedesktop.DBus"
-                and msg.path == "/org/freedesktop/DBus"
-                and msg.interface == "org.freedesktop.DBus"
+                msg.member == _NAME_OWNER_CHANGED
+                and msg.sender == _DBUS_NAME
+                and msg.path == _DBUS_PATH
+                and msg.interface == _DBUS_NAME
             ):
                 [name, old_owner, new_owner] = msg.body
                 if new_owner:
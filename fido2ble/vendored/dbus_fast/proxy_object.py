@@ -5,10 +5,11 @@ import re
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import Callable, Coroutine, Dict, List, Optional, Type, Union
+from typing import Callable, Coroutine, Dict, List, Optional, Tuple, Type, Union
 
 from . import introspection as intr
 from . import message_bus
+from ._private.unmarshaller import STRING_CACHE
 from ._private.util import replace_idx_with_fds
 from .constants import ErrorType, MessageType
 from .errors import DBusError, InterfaceNotFoundError
@@ -59,11 +60,19 @@ class BaseProxyInterface:
         bus: "message_bus.BaseMessageBus",
     ) -> None:
         self.bus_name = bus_name
-        self.path = path
+        # signals decoded for this proxy carry these very objects, see StringCache.pin,
+        # so the comparisons in _message_handler succeed on identity
+        self.path = STRING_CACHE.pin(path)
+        self._interface_name = STRING_CACHE.pin(introspection.name)
         self.introspection = introspection
         self.bus = bus
         self._signal_handlers: Dict[str, List[SignalHandler]] = {}
         self._signal_match_rule = f"type='signal',sender={bus_name},interface={introspection.name},path={path}"
+        # signal name to the signal, its signature and whether its body can skip the fd walk
+        self._signals: Dict[str, Tuple[intr.Signal, str, bool]] = {
+            STRING_CACHE.pin(s.name): (s, STRING_CACHE.pin(s.signature), self._fd_free(s.signature))
+            for s in introspection.signals
+        }
 
     _underscorer1 = re.compile(r"(.)([A-Z][a-z]+)")
     _underscorer2 = re.compile(r"([a-z0-9])([A-Z])")
@@ -89,6 +98,27 @@ class BaseProxyInterface:
                 msg,
             )
 
+    @staticmethod
+    def _members(introspection: intr.Interface) -> Tuple:
+        """Everything of an interface the generated members depend on."""
+        return (
+            tuple(
+                (m.name, m.in_signature, m.out_signature, len(m.out_args))
+                for m in introspection.methods
+            ),
+            tuple((p.name, p.signature) for p in introspection.properties),
+            tuple((s.name, s.signature, len(s.args)) for s in introspection.signals),
+        )
+
+    def _fd_free(self, signature: str) -> bool:
+        """True if no value of ``signature`` can be a unix fd on this bus.
+
+        Variants only carry fds when the bus negotiated fd passing.
+        """
+        return "h" not in signature and (
+            "v" not in signature or not self.bus._negotiate_unix_fd
+        )
+
     def _add_method(self, intr_method: intr.Method) -> None:
         raise NotImplementedError("this must be implemented in the inheriting class")
 
@@ -98,7 +128,7 @@ class BaseProxyInterface:
     def _message_handler(self, msg: Message) -> None:
         if (
             msg.message_type != MessageType.SIGNAL
-            or msg.interface != self.introspection.name
+            or msg.interface != self._interface_name
             or msg.path != self.path
             or msg.member not in self._signal_handlers
         ):
@@ -114,17 +144,20 @@ class BaseProxyInterface:
             # on the bus for this purpose.
             return
 
-        match = [s for s in self.introspection.signals if s.name == msg.member]
-        if not len(match):
+        signal = self._signals.get(msg.member)
+        if signal is None:
             return
-        intr_signal = match[0]
-        if intr_signal.signature != msg.signature:
+        intr_signal, signature, fd_free = signal
+        if signature != msg.signature:
             logging.warning(
                 f'got signal "{self.introspection.name}.{msg.member}" with unexpected signature "{msg.signature}"'
             )
             return
 
-        body = replace_idx_with_fds(msg.signature, msg.body, msg.unix_fds)
+        if fd_free:
+            body = msg.body
+        else:
+            body = replace_idx_with_fds(msg.signature, msg.body, msg.unix_fds)
         no_sig = None
         for handler in self._signal_handlers[msg.member]:
             if handler.unpack_variants:
@@ -139,6 +172,9 @@ class BaseProxyInterface:
                 asyncio.create_task(cb_result)
 
     def _add_signal(self, intr_signal: intr.Signal, interface: intr.Interface) -> None:
+        # the key _message_handler looks the member of a signal up with
+        name = STRING_CACHE.pin(intr_signal.name)
+
         def on_signal_fn(fn: Callable, *, unpack_variants: bool = False):
             fn_signature = inspect.signature(fn)
             if 0 < len(
@@ -171,21 +207,21 @@ class BaseProxyInterface:
                 self.bus._add_match_rule(self._signal_match_rule)
                 self.bus.add_message_handler(self._message_handler)
 
-            if intr_signal.name not in self._signal_handlers:
-                self._signal_handlers[intr_signal.name] = []
+            if name not in self._signal_handlers:
+                self._signal_handlers[name] = []
 
-            self._signal_handlers[intr_signal.name].append(
+            self._signal_handlers[name].append(
                 SignalHandler(fn, unpack_variants)
             )
 
         def off_signal_fn(fn: Callable, *, unpack_variants: bool = False) -> None:
             try:
-                i = self._signal_handlers[intr_signal.name].index(
+                i = self._signal_handlers[name].index(
                     SignalHandler(fn, unpack_variants)
                 )
-                del self._signal_handlers[intr_signal.name][i]
-                if not self._signal_handlers[intr_signal.name]:
-                    del self._signal_handlers[intr_signal.name]
+                del self._signal_handlers[name][i]
+                if not self._signal_handlers[name]:
+                    del self._signal_handlers[name]
             except (KeyError, ValueError):
                 return
 
@@ -290,6 +326,20 @@ class BaseProxyObject:
         except StopIteration:
             raise InterfaceNotFoundError(f"interface not found on this object: {name}")
 
+        # proxies are interned per bus, bus name, path and interface, so proxy
+        # objects built again for the same path share one set of stubs and one
+        # signal subscription
+        key = (self.bus_name, self.path, name)
+        interned = self.bus._proxy_interfaces.get(key)
+        if (
+            interned is not None
+            and type(interned) is self.ProxyInterface
+            and BaseProxyInterface._members(interned.introspection)
+            == BaseProxyInterface._members(intr_interface)
+        ):
+            self._interfaces[name] = interned
+            return interned
+
         interface = self.ProxyInterface(
             self.bus_name, self.path, intr_interface, self.bus
         )
@@ -328,6 +378,7 @@ class BaseProxyObject:
             )
 
         self._interfaces[name] = interface
+        self.bus._proxy_interfaces[key] = interface
         return interface
 
     def get_children(self) -> List["BaseProxyObject"]:
@@ -4,6 +4,7 @@
 from __future__ import annotations
 
 import asyncio
+import collections
 import ctypes
 import enum
 import fcntl
@@ -14,16 +15,14 @@ import os
 import os.path
 import select
 import struct
+import threading
 import time
 import typing
-import uuid
 
 from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Type, Union
 
 
 if typing.TYPE_CHECKING:
-    import threading  # pragma: no cover
-
     import trio  # pragma: no cover
 
 
@@ -384,6 +383,96 @@ class AsyncioBlockingUHID(_BlockingUHIDBase):
             self._writer_registered = True
 
 
+class UHIDThread(object):
+    '''
+    One epoll thread servicing the UHID fds of any number of ThreadedBlockingUHID
+
+    Events read from the devices are handed to the asyncio loop with
+    call_soon_threadsafe, so callbacks still run on the loop. Outgoing events
+    go through a deque, whose append and popleft are atomic, and a pipe wakes
+    the thread up to write them. Neither direction waits for the loop to get
+    around to an fd callback.
+    '''
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.__logger = logging.getLogger(self.__class__.__name__)
+        self._loop = loop if loop else asyncio.get_event_loop()
+        self._poller = select.epoll()
+        self._backends: Dict[int, ThreadedBlockingUHID] = {}
+        self._outgoing: collections.deque[typing.Tuple[ThreadedBlockingUHID, bytes]] = collections.deque()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._poller.register(self._wakeup_read, select.EPOLLIN)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.dispatch, name='uhid', daemon=True)
+        self._thread.start()
+
+    def register(self, backend: ThreadedBlockingUHID) -> None:
+        self._backends[backend._uhid] = backend
+        self._poller.register(backend._uhid, select.EPOLLIN)
+
+    def send(self, backend: ThreadedBlockingUHID, event: bytes) -> None:
+        self._outgoing.append((backend, event))
+        self._wakeup()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup()
+        self._thread.join()
+
+    def _wakeup(self) -> None:
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except BlockingIOError:
+            # the pipe is full of wakeups the thread has not consumed yet
+            pass
+
+    def dispatch(self) -> None:
+        loop = self._loop
+        outgoing = self._outgoing
+        while not self._stop.is_set():
+            for fd, _event_type in self._poller.poll():
+                if fd == self._wakeup_read:
+                    try:
+                        os.read(self._wakeup_read, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                backend = self._backends[fd]
+                try:
+                    callback = backend._receive_dispatch(os.read(fd, ctypes.sizeof(_Event)))
+                except OSError as error:
+                    self.__logger.error(f'reading {fd} failed, no longer polling it: {error}')
+                    self._poller.unregister(fd)
+                    del self._backends[fd]
+                    continue
+                if callback:
+                    loop.call_soon_threadsafe(callback)
+            while outgoing:
+                backend, event = outgoing.popleft()
+                try:
+                    backend._write(event)
+                except OSError as error:
+                    self.__logger.error(f'writing to {backend._uhid} failed: {error}')
+
+
+class ThreadedBlockingUHID(_BlockingUHIDBase):
+    '''
+    Blocking IO UHID implementation serviced by a shared UHIDThread
+
+    Pass ``functools.partial(ThreadedBlockingUHID, thread)`` as the backend.
+    '''
+
+    def __init__(self, thread: UHIDThread) -> None:
+        super().__init__()
+        self._thread = thread
+        thread.register(self)
+
+    def _send_event(self, event: bytes) -> None:
+        self._thread.send(self, event)
+
+
 class TrioUHID(_UHIDBase):
     '''
     Trio UHID implementation
@@ -438,6 +527,8 @@ class _UHIDDeviceBase(object):
         country: int = 0,
     ) -> None:
         if not unique_name:
+            import uuid  # only needed for the default name, keeps it off the import path
+
             unique_name = f'{self.__class__.__name__}_{uuid.uuid4()}'[:63]
 
         if not physical_name:
@@ -551,7 +642,7 @@ class UHIDDevice(_UHIDDeviceBase):
         unique_name: Optional[str] = None,
         version: int = 0,
         country: int = 0,
-        backend: Type[Union[PolledBlockingUHID, AsyncioBlockingUHID]] = PolledBlockingUHID,
+        backend: Callable[[], Union[PolledBlockingUHID, AsyncioBlockingUHID, ThreadedBlockingUHID]] = PolledBlockingUHID,
     ) -> None:
         uhid = backend()
         super().__init__(uhid, vid, pid, name, report_descriptor, bus, physical_name, unique_name, version, country)
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from fido2ble.CTAPFraming import (FramingError, HID_MAX_MESSAGE_SIZE, HID_PACKET_SIZE, Reassembler, ble_fragments,
+                                  hid_fragments, reassemble)
+
+HID_INIT_CAPACITY = HID_PACKET_SIZE - 7
+HID_CONT_CAPACITY = HID_PACKET_SIZE - 5
+HID_LENGTHS = (0, 1, HID_INIT_CAPACITY, HID_INIT_CAPACITY + 1, HID_INIT_CAPACITY + HID_CONT_CAPACITY,
+               HID_INIT_CAPACITY + HID_CONT_CAPACITY + 1, 1024, HID_MAX_MESSAGE_SIZE)
+BLE_FRAGMENT_SIZES = (20, 23, 64, 128, 512)
+
+
+def payload_of(length: int, seed: int = 0) -> bytes:
+    return random.Random(seed * 65536 + length).randbytes(length)
+
+
+def hid_frame_count(length: int) -> int:
+    if length <= HID_INIT_CAPACITY:
+        return 1
+    return 1 + -(-(length - HID_INIT_CAPACITY) // HID_CONT_CAPACITY)
+
+
+def test_hid_limit_matches_sequence_space():
+    assert HID_MAX_MESSAGE_SIZE == 7609
+
+
+@pytest.mark.parametrize("length", HID_LENGTHS)
+def test_hid_round_trip(length):
+    payload = payload_of(length)
+    frames = [bytes(frame) for frame in hid_fragments(0x01020304, 0x10, payload)]
+    assert len(frames) == hid_frame_count(length)
+    assert all(len(frame) == HID_PACKET_SIZE for frame in frames)
+    assert all(frame[:4] == bytes((1, 2, 3, 4)) for frame in frames)
+    assert list(reassemble(frame[4:] for frame in frames)) == [(0x90, payload)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_hid_round_trip_random_lengths(seed):
+    rng = random.Random(seed)
+    lengths = [rng.randrange(HID_MAX_MESSAGE_SIZE + 1) for _ in range(5)]
+    payloads = [payload_of(length, seed) for length in lengths]
+    frames = [frame[4:] for payload in payloads for frame in hid_fragments(7, 0x03, payload)]
+    assert list(reassemble(frames)) == [(0x83, payload) for payload in payloads]
+
+
+def test_hid_last_frame_is_zero_padded():
+    payload = b"\xff" * (HID_INIT_CAPACITY + HID_CONT_CAPACITY + 1)
+    last = bytes(list(hid_fragments(1, 0x10, payload))[-1])
+    assert last[5:] == b"\xff" + bytes(HID_PACKET_SIZE - 6)
+
+
+def test_hid_over_length():
+    assert len(list(hid_fragments(1, 0x10, bytes(HID_MAX_MESSAGE_SIZE)))) == 0x80 + 1
+    with pytest.raises(FramingError):
+        list(hid_fragments(1, 0x10, bytes(HID_MAX_MESSAGE_SIZE + 1)))
+
+
+@pytest.mark.parametrize("fragment_size", BLE_FRAGMENT_SIZES)
+@pytest.mark.parametrize("offset", (-1, 0, 1))
+def test_ble_round_trip_at_fragment_boundaries(fragment_size, offset):
+    for length in (0, fragment_size - 3 + offset, fragment_size - 3 + fragment_size - 1 + offset, 7609):
+        if length < 0:
+            continue
+        payload = payload_of(length)
+        frames = [bytes(frame) for frame in ble_fragments(0x83, payload, fragment_size)]
+        assert all(len(frame) <= fragment_size for frame in frames)
+        assert list(reassemble(frames, check_sequence=False)) == [(0x83, payload)]
+
+
+@pytest.mark.parametrize("fragment_size", (0, 1, 3))
+def test_ble_fragment_size_without_room_for_payload(fragment_size):
+    with pytest.raises(FramingError):
+        list(ble_fragments(0x83, payload_of(10), fragment_size))
+
+
+def test_ble_sequence_wraps():
+    payload = payload_of(7609)
+    frames = [bytes(frame) for frame in ble_fragments(0x83, payload, 20)]
+    assert len(frames) > 0x80
+    assert frames[0x81][0] == 0x00
+    assert list(reassemble(frames, check_sequence=False)) == [(0x83, payload)]
+
+
+def test_out_of_sequence():
+    frames = [frame[4:] for frame in hid_fragments(1, 0x10, payload_of(200))]
+    reassembler = Reassembler()
+    assert reassembler.feed(frames[0]) is None
+    with pytest.raises(FramingError):
+        reassembler.feed(frames[2])
+
+
+def test_repeated_sequence():
+    frames = [frame[4:] for frame in hid_fragments(1, 0x10, payload_of(200))]
+    reassembler = Reassembler()
+    reassembler.feed(frames[0])
+    reassembler.feed(frames[1])
+    with pytest.raises(FramingError):
+        reassembler.feed(frames[1])
+
+
+def test_continuation_without_initialization():
+    frames = [frame[4:] for frame in hid_fragments(1, 0x10, payload_of(200))]
+    with pytest.raises(FramingError):
+        Reassembler().feed(frames[1])
+
+
+def test_continuation_after_complete_message():
+    frames = [frame[4:] for frame in hid_fragments(1, 0x10, payload_of(100))]
+    reassembler = Reassembler()
+    reassembler.feed(frames[0])
+    assert reassembler.feed(frames[1]) is not None
+    with pytest.raises(FramingError):
+        reassembler.feed(frames[1])
@@ -0,0 +1,102 @@
+import asyncio
+
+from fido2ble.FrameScheduler import FrameScheduler
+
+
+class Link:
+    """Records written frames, each write takes one loop iteration like a D-Bus call or a report would."""
+
+    def __init__(self):
+        self.frames = []
+
+    async def write(self, frame):
+        await asyncio.sleep(0)
+        self.frames.append(frame)
+
+
+def message(name: str, count: int) -> list:
+    return [f"{name}{index}" for index in range(count)]
+
+
+def test_control_overtakes_waiting_bulk():
+    async def scenario():
+        scheduler = FrameScheduler("test")
+        link = Link()
+        first = asyncio.create_task(scheduler.send(message("a", 3), link.write))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(scheduler.send(message("b", 2), link.write))
+        third = asyncio.create_task(scheduler.send(message("c", 2), link.write))
+        await asyncio.sleep(0)
+        control = asyncio.create_task(scheduler.send(message("k", 1), link.write, control=True))
+        await asyncio.gather(first, second, third, control)
+        return scheduler, link
+
+    scheduler, link = asyncio.run(scenario())
+    assert link.frames == ["a0", "a1", "a2", "k0", "b0", "b1", "c0", "c1"]
+    assert scheduler.stats()["overtaken"] == 2
+    assert scheduler.stats()["control_sent"] == 1
+    assert scheduler.stats()["bulk_sent"] == 3
+
+
+def test_messages_of_one_class_keep_their_order():
+    async def scenario():
+        scheduler = FrameScheduler("test")
+        link = Link()
+        senders = [asyncio.create_task(scheduler.send(message(name, 2), link.write, control=True)) for name in "xyz"]
+        await asyncio.gather(*senders)
+        return link
+
+    assert asyncio.run(scenario()).frames == ["x0", "x1", "y0", "y1", "z0", "z1"]
+
+
+def test_cancelled_sender_finishes_its_message_before_control():
+    async def scenario():
+        scheduler = FrameScheduler("test")
+        link = Link()
+        bulk = asyncio.create_task(scheduler.send(message("a", 4), link.write))
+        while not link.frames:
+            await asyncio.sleep(0)
+        assert len(link.frames) < 4
+        bulk.cancel()
+        await scheduler.send(message("k", 1), link.write, control=True)
+        return scheduler, link, bulk
+
+    scheduler, link, bulk = asyncio.run(scenario())
+    assert bulk.cancelled()
+    assert link.frames == ["a0", "a1", "a2", "a3", "k0"]
+    assert scheduler.stats()["completed_after_cancel"] == 1
+
+
+def test_sender_cancelled_before_its_first_frame_drops_the_message():
+    async def scenario():
+        scheduler = FrameScheduler("test")
+        link = Link()
+        first = asyncio.create_task(scheduler.send(message("a", 2), link.write))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(scheduler.send(message("b", 2), link.write))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await first
+        await scheduler.send(message("c", 1), link.write)
+        return scheduler, link
+
+    scheduler, link = asyncio.run(scenario())
+    assert link.frames == ["a0", "a1", "c0"]
+    assert scheduler.stats()["waiting_bulk"] == 0
+
+
+def test_failed_write_releases_the_scheduler():
+    async def failing(frame):
+        raise OSError("gone")
+
+    async def scenario():
+        scheduler = FrameScheduler("test")
+        link = Link()
+        try:
+            await scheduler.send(message("a", 2), failing)
+        except OSError:
+            pass
+        await asyncio.wait_for(scheduler.send(message("b", 1), link.write), 1)
+        return link
+
+    assert asyncio.run(scenario()).frames == ["b0"]
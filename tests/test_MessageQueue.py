@@ -0,0 +1,60 @@
+from fido2ble.MessageQueue import MessageQueue
+
+
+def filled(count: int) -> MessageQueue:
+    queue = MessageQueue("test", high_watermark=4, low_watermark=2)
+    for item in range(count):
+        assert queue.put(item)
+    return queue
+
+
+def test_messages_keep_their_order():
+    queue = filled(3)
+    assert [queue.get() for _ in range(3)] == [0, 1, 2]
+    assert len(queue) == 0
+
+
+def test_put_is_refused_at_the_high_watermark():
+    queue = filled(4)
+    assert not queue.put(4)
+    assert queue.congested
+    assert len(queue) == 4
+    assert queue.stats() == {"depth": 4, "peak": 4, "enqueued": 4, "rejected": 1, "congestions": 1}
+
+
+def test_put_stays_refused_until_the_low_watermark():
+    queue = filled(4)
+    assert not queue.put("over")
+    assert queue.get() == 0
+    # below the high watermark but still above the low one
+    assert not queue.put("still over")
+    assert queue.get() == 1
+    assert not queue.congested
+    assert queue.put("accepted")
+    assert [queue.get() for _ in range(len(queue))] == [2, 3, "accepted"]
+    stats = queue.stats()
+    assert stats["rejected"] == 2
+    assert stats["congestions"] == 1
+
+
+def test_each_congestion_is_counted_once():
+    queue = filled(4)
+    for _ in range(3):
+        queue.put("over")
+    queue.get()
+    queue.get()
+    queue.put(4)
+    queue.put(5)
+    queue.put("over")
+    assert queue.stats()["congestions"] == 2
+    assert queue.stats()["rejected"] == 4
+
+
+def test_clear_ends_congestion():
+    queue = filled(4)
+    queue.put("over")
+    queue.clear()
+    assert not queue.congested
+    assert len(queue) == 0
+    assert queue.put("after")
+    assert queue.stats()["peak"] == 4
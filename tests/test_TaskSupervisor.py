@@ -0,0 +1,107 @@
+import asyncio
+
+from fido2ble.TaskSupervisor import TaskSupervisor
+
+
+def test_finished_tasks_leave_the_supervisor():
+    async def scenario():
+        supervisor = TaskSupervisor("test")
+        task = supervisor.spawn(asyncio.sleep(0, result="done"))
+        assert len(supervisor) == 1
+        assert await task == "done"
+        await asyncio.sleep(0)
+        return supervisor
+
+    supervisor = asyncio.run(scenario())
+    assert len(supervisor) == 0
+    assert supervisor.stats() == {"in_flight": 0, "spawned": 1, "finished": 1, "cancelled": 0}
+
+
+def test_failed_task_counts_as_finished():
+    async def failing():
+        raise OSError("gone")
+
+    async def scenario():
+        supervisor = TaskSupervisor("test")
+        task = supervisor.spawn(failing())
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        return supervisor
+
+    assert asyncio.run(scenario()).stats()["finished"] == 1
+
+
+def test_cancel_spares_the_caller_and_kept_tasks():
+    async def scenario():
+        supervisor = TaskSupervisor("test")
+        never = asyncio.Event()
+        doomed = supervisor.spawn(never.wait(), name="doomed")
+        kept = supervisor.spawn(never.wait(), name="kept")
+
+        async def canceller():
+            supervisor.cancel(keep=lambda task: task.get_name() == "kept")
+            await asyncio.sleep(0)
+            return "survived"
+
+        caller = supervisor.spawn(canceller())
+        assert await caller == "survived"
+        await asyncio.gather(doomed, return_exceptions=True)
+        await asyncio.sleep(0)
+        state = (doomed.cancelled(), kept.done(), supervisor.stats())
+        kept.cancel()
+        await asyncio.gather(kept, return_exceptions=True)
+        return state
+
+    doomed_cancelled, kept_done, stats = asyncio.run(scenario())
+    assert doomed_cancelled
+    assert not kept_done
+    assert stats == {"in_flight": 1, "spawned": 3, "finished": 1, "cancelled": 1}
+
+
+def test_bounded_tasks_wait_for_a_slot():
+    async def scenario():
+        supervisor = TaskSupervisor("test", max_in_flight=2)
+        release = asyncio.Event()
+        running = 0
+        most_running = 0
+
+        async def work():
+            nonlocal running, most_running
+            running += 1
+            most_running = max(most_running, running)
+            await release.wait()
+            running -= 1
+
+        tasks = [supervisor.spawn(work()) for _ in range(5)]
+        unbounded = supervisor.spawn(work(), bounded=False)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        started = running
+        release.set()
+        await asyncio.gather(*tasks, unbounded)
+        return started, most_running
+
+    started, most_running = asyncio.run(scenario())
+    # two bounded tasks hold the slots, the unbounded one runs next to them
+    assert started == 3
+    assert most_running == 3
+
+
+def test_cancel_while_waiting_for_a_slot_closes_the_coroutine():
+    async def scenario():
+        supervisor = TaskSupervisor("test", max_in_flight=1)
+        never = asyncio.Event()
+        holder = supervisor.spawn(never.wait())
+        await asyncio.sleep(0)
+        waiting_coro = never.wait()
+        waiting = supervisor.spawn(waiting_coro)
+        await asyncio.sleep(0)
+        supervisor.cancel()
+        await asyncio.gather(holder, waiting, return_exceptions=True)
+        await asyncio.sleep(0)
+        return supervisor, waiting_coro
+
+    supervisor, waiting_coro = asyncio.run(scenario())
+    assert waiting_coro.cr_frame is None
+    assert supervisor.stats()["cancelled"] == 2
+    assert len(supervisor) == 0
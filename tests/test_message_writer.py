@@ -0,0 +1,156 @@
+import asyncio
+import os
+import socket
+
+from fido2ble.vendored.dbus_fast import Message
+from fido2ble.vendored.dbus_fast.aio.message_bus import SENDMSG_MAX_BUFFERS, _MessageWriter
+
+
+class Socket:
+    """Accepts at most ``limit`` bytes per sendmsg call, none raises BlockingIOError."""
+
+    def __init__(self, limit: int = 1 << 20):
+        self.limit = limit
+        self.data = bytearray()
+        self.calls = []
+
+    def sendmsg(self, buffers, ancdata=()):
+        if not self.limit:
+            raise BlockingIOError()
+        self.calls.append((len(buffers), ancdata))
+        sent = bytes(b"".join(buffers))[:self.limit]
+        self.data += sent
+        return len(sent)
+
+
+class Loop:
+    def __init__(self):
+        self.writer = None
+
+    def add_writer(self, fd, callback):
+        self.writer = callback
+
+    def remove_writer(self, fd):
+        self.writer = None
+
+
+class Bus:
+    def __init__(self, sock: Socket, negotiate_unix_fd: bool = False):
+        self._negotiate_unix_fd = negotiate_unix_fd
+        self._sock = sock
+        self._loop = Loop()
+        self._fd = -1
+        self._user_disconnect = False
+        self.unique_name = ":1.1"
+        self.error = None
+
+    def _finalize(self, err=None):
+        self.error = err
+
+
+def signal(serial: int, value: str = "x") -> Message:
+    message = Message.new_signal("/org/bluez/hci0", "org.example.Test", "Changed", "s", [value])
+    message.serial = serial
+    return message
+
+
+def marshalled(*messages: Message) -> bytes:
+    return b"".join(bytes(message._marshall(False)) for message in messages)
+
+
+def test_queued_messages_are_flushed_with_one_sendmsg():
+    async def scenario():
+        sock = Socket()
+        writer = _MessageWriter(Bus(sock))
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in range(3)]
+        for serial, future in enumerate(futures, 1):
+            writer.buffer_message(signal(serial), future)
+        writer.write_callback()
+        return sock, writer, futures
+
+    sock, writer, futures = asyncio.run(scenario())
+    assert sock.calls == [(6, ())]
+    assert sock.data == marshalled(signal(1), signal(2), signal(3))
+    assert all(future.done() for future in futures)
+    assert not writer.messages
+
+
+def test_partial_sendmsg_resumes_where_it_stopped():
+    async def scenario():
+        sock = Socket(limit=7)
+        bus = Bus(sock)
+        writer = _MessageWriter(bus)
+        loop = asyncio.get_running_loop()
+        first, second = loop.create_future(), loop.create_future()
+        writer.schedule_write(signal(1, "first"), first)
+        writer.schedule_write(signal(2, "second"), second)
+        assert bus._loop.writer is not None
+        first_length = len(marshalled(signal(1, "first")))
+        done_at = {}
+        while bus._loop.writer is not None:
+            bus._loop.writer()
+            for name, future in (("first", first), ("second", second)):
+                if future.done() and name not in done_at:
+                    done_at[name] = len(sock.data)
+        return sock, writer, done_at, first_length
+
+    sock, writer, done_at, first_length = asyncio.run(scenario())
+    assert sock.data == marshalled(signal(1, "first"), signal(2, "second"))
+    # a future resolves once the last byte of its message is out, not before
+    assert first_length <= done_at["first"] < first_length + 7
+    assert done_at["second"] == len(sock.data)
+    assert not writer.messages
+
+
+def test_full_socket_keeps_the_queue():
+    async def scenario():
+        sock = Socket(limit=0)
+        bus = Bus(sock)
+        writer = _MessageWriter(bus)
+        future = asyncio.get_running_loop().create_future()
+        writer.schedule_write(signal(1), future)
+        assert not future.done()
+        assert bus._loop.writer is not None
+        sock.limit = 1 << 20
+        bus._loop.writer()
+        return sock, bus, future
+
+    sock, bus, future = asyncio.run(scenario())
+    assert future.done()
+    assert sock.data == marshalled(signal(1))
+    assert bus._loop.writer is None
+    assert bus.error is None
+
+
+def test_sendmsg_is_capped_at_the_buffer_limit():
+    sock = Socket()
+    writer = _MessageWriter(Bus(sock))
+    count = SENDMSG_MAX_BUFFERS // 2 + 3
+    for serial in range(1, count + 1):
+        writer.buffer_message(signal(serial))
+    writer.write_callback()
+    assert [buffers for buffers, _ in sock.calls] == [SENDMSG_MAX_BUFFERS, 6]
+    assert sock.data == marshalled(*(signal(serial) for serial in range(1, count + 1)))
+
+
+def test_message_with_fds_is_sent_on_its_own():
+    read_fd, write_fd = os.pipe()
+    try:
+        sock = Socket()
+        writer = _MessageWriter(Bus(sock, negotiate_unix_fd=True))
+        with_fd = Message.new_signal("/org/bluez/hci0", "org.example.Test", "Fd", "h", [0])
+        with_fd.unix_fds = [read_fd]
+        with_fd.serial = 2
+        writer.buffer_message(signal(1))
+        writer.buffer_message(with_fd)
+        writer.buffer_message(signal(3))
+        writer.write_callback()
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+    assert [buffers for buffers, _ in sock.calls] == [2, 2, 2]
+    assert sock.calls[0][1] == ()
+    ((level, kind, fds),) = sock.calls[1][1]
+    assert (level, kind, list(fds)) == (socket.SOL_SOCKET, socket.SCM_RIGHTS, [read_fd])
+    assert sock.calls[2][1] == ()
@@ -0,0 +1,150 @@
+import io
+import socket
+
+from fido2ble.vendored.dbus_fast import Message, MessageType, Variant
+from fido2ble.vendored.dbus_fast._private.unmarshaller import STRING_CACHE, StringCache, Unmarshaller
+
+STATUS_PATH = "/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF/service0010/char0012"
+
+
+def fresh(string: str) -> str:
+    """An equal string that is not the same object."""
+    return string.encode().decode()
+
+
+def unmarshall(message: Message, **kwargs) -> Message:
+    return Unmarshaller(io.BytesIO(bytes(message._marshall(False))), **kwargs).unmarshall()
+
+
+def properties_changed(path: str) -> Message:
+    return Message(
+        message_type=MessageType.SIGNAL,
+        path=path,
+        interface="org.freedesktop.DBus.Properties",
+        member="PropertiesChanged",
+        signature="sa{sv}as",
+        body=["org.bluez.GattCharacteristic1", {"Value": Variant("ay", b"\x83\x00\x01\x00")}, []],
+    )
+
+
+def test_pinned_strings_are_decoded_as_the_same_object():
+    path = STRING_CACHE.pin(fresh(STATUS_PATH))
+    member = STRING_CACHE.pin("PropertiesChanged")
+    message = unmarshall(properties_changed(STATUS_PATH))
+    assert message.path is path
+    assert message.member is member
+
+
+def test_repeated_strings_are_shared():
+    first = unmarshall(properties_changed(STATUS_PATH))
+    second = unmarshall(properties_changed(STATUS_PATH))
+    assert first.interface is second.interface
+    assert next(iter(first.body[1])) is next(iter(second.body[1]))
+
+
+def test_reset_keeps_pinned_strings():
+    cache = StringCache(max_size=2)
+    pinned = cache.pin(fresh("Connected"))
+    for string in ("a", "b", "c", "d"):
+        cache.get(string)
+    assert cache.resets > 0
+    assert cache.get(fresh("Connected")) is pinned
+    assert len(cache.strings) <= 3
+
+
+DEVICE_PATH = "/org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF"
+MANAGED_OBJECTS = {
+    "/org/bluez/hci0": {
+        "org.bluez.Adapter1": {"Powered": Variant("b", True)},
+    },
+    DEVICE_PATH: {
+        "org.freedesktop.DBus.Introspectable": {},
+        "org.bluez.Device1": {"Paired": Variant("b", True), "UUIDs": Variant("as", ["0000fffd-0000-1000-8000-00805f9b34fb"])},
+    },
+    STATUS_PATH: {
+        "org.bluez.GattCharacteristic1": {"UUID": Variant("s", "f1d0fff2-deaa-ecee-b42f-c9ba7ed623bb")},
+    },
+    "/org/other": {
+        "org.bluez.Device1": {"Paired": Variant("b", False)},
+    },
+}
+
+
+def managed_objects_reply(serial: int = 7) -> Message:
+    return Message(
+        message_type=MessageType.METHOD_RETURN,
+        reply_serial=serial,
+        signature="a{oa{sa{sv}}}",
+        body=[MANAGED_OBJECTS],
+    )
+
+
+class Trickle(io.RawIOBase):
+    """A stream that hands out ``size`` bytes per read and None in between, like a socket without more data."""
+
+    def __init__(self, data: bytes, size: int):
+        self.data = data
+        self.size = size
+        self.offset = 0
+        self.starved = False
+
+    def read(self, size=-1):
+        self.starved = not self.starved
+        if self.starved:
+            return None
+        chunk = self.data[self.offset:self.offset + min(size, self.size)]
+        self.offset += len(chunk)
+        return chunk
+
+
+def test_managed_objects_without_a_filter_are_decoded_in_full():
+    message = unmarshall(managed_objects_reply(), body_filters={8: ("/org/bluez/", None)})
+    assert message.body[0] == MANAGED_OBJECTS
+
+
+def test_managed_objects_filter_keeps_matching_paths_and_interfaces():
+    filters = {7: ("/org/bluez/", frozenset(("org.bluez.Device1", "org.bluez.GattCharacteristic1")))}
+    objects = unmarshall(managed_objects_reply(), body_filters=filters).body[0]
+    assert objects == {
+        # kept by its path even though none of its interfaces is wanted
+        "/org/bluez/hci0": {},
+        DEVICE_PATH: {"org.bluez.Device1": MANAGED_OBJECTS[DEVICE_PATH]["org.bluez.Device1"]},
+        STATUS_PATH: MANAGED_OBJECTS[STATUS_PATH],
+    }
+
+
+def test_managed_objects_filter_without_interfaces_keeps_whole_objects():
+    objects = unmarshall(managed_objects_reply(), body_filters={7: (DEVICE_PATH + "/", None)}).body[0]
+    assert objects == {STATUS_PATH: MANAGED_OBJECTS[STATUS_PATH]}
+
+
+def test_managed_objects_filter_resumes_across_chunked_reads():
+    data = bytes(managed_objects_reply()._marshall(False))
+    stream = Trickle(data, 5)
+    unmarshaller = Unmarshaller(stream, body_filters={7: ("/org/bluez/", frozenset(("org.bluez.Device1",)))})
+    attempts = 0
+    message = None
+    while message is None:
+        attempts += 1
+        assert attempts <= 2 * len(data)
+        message = unmarshaller.unmarshall()
+    assert stream.offset == len(data)
+    assert message.body[0][DEVICE_PATH] == {"org.bluez.Device1": MANAGED_OBJECTS[DEVICE_PATH]["org.bluez.Device1"]}
+    assert message.body[0][STATUS_PATH] == {}
+    assert "/org/other" not in message.body[0]
+
+
+def test_managed_objects_filter_resumes_across_socket_reads():
+    data = bytes(managed_objects_reply()._marshall(False))
+    reader, writer = socket.socketpair()
+    with reader, writer:
+        reader.setblocking(False)
+        unmarshaller = Unmarshaller(sock=reader, negotiate_unix_fd=False,
+                                    body_filters={7: ("/org/bluez/", frozenset(("org.bluez.Device1",)))})
+        assert unmarshaller.unmarshall() is None
+        for offset in range(0, len(data), 16):
+            assert unmarshaller.unmarshall() is None
+            writer.send(data[offset:offset + 16])
+        message = unmarshaller.unmarshall()
+    assert set(message.body[0]) == {"/org/bluez/hci0", DEVICE_PATH, STATUS_PATH}
+    assert message.body[0][DEVICE_PATH]["org.bluez.Device1"]["Paired"].value is True